@@ -2,10 +2,14 @@
 Angel One broker API integration module.
 Handles authentication, order placement, websocket connections, and other broker interactions.
 """
+import os
 import time
+import asyncio
 import random
+import socket
+import sys
 import pyotp
-import json
+import orjson
 from datetime import datetime
 import threading
 
@@ -13,6 +17,7 @@ from SmartApi import SmartConnect
 from SmartApi.smartWebSocketV2 import SmartWebSocketV2
 
 from ..utils.logger import logger, log_exception, log_order
+from ..utils.rate_limiter import TokenBucket
 from ..config import settings
 
 class AngelOneBroker:
@@ -29,13 +34,31 @@ class AngelOneBroker:
         self.websocket = None
         self.is_connected = False
         
-        self._last_order_time = 0
-        self._minute_order_count = 0
-        self._minute_start_time = time.time()
+        # Shared request limits across all broker endpoints
+        self._rate_lock = threading.Lock()
+        self._last_wait_log = 0.0
+        self.reload_limits()
         
-        self._last_status_check = 0
-        self._minute_status_count = 0
-        self._minute_status_start = time.time()
+        # TOTP values are constant within a time step, cache the last one
+        self._totp = None
+        self._totp_ctr = -1
+        self._totp_val = None
+        
+        # Last order book response indexed by order ID: (fetched_at, index)
+        self._orderbook_cache = (float('-inf'), {})
+        
+    def reload_limits(self):
+        """
+        Rebuild the rate limiters and cached limit values from settings.
+        Call this after changing the request limits at runtime.
+        """
+        with self._rate_lock:
+            self._max_per_sec = settings.MAX_REQUESTS_PER_SECOND
+            self._max_per_min = settings.MAX_REQUESTS_PER_MINUTE
+            self._sec_bucket = TokenBucket(self._max_per_sec, capacity=self._max_per_sec)
+            self._min_bucket = TokenBucket(self._max_per_min / 60.0, capacity=self._max_per_min)
+            self._wait_log_interval = settings.RATE_LIMIT_LOG_INTERVAL
+            self._orderbook_ttl = settings.ORDER_BOOK_CACHE_TTL
         
     def generate_totp(self):
         """
@@ -45,12 +68,75 @@ class AngelOneBroker:
             str: TOTP code
         """
         try:
-            totp = pyotp.TOTP(settings.TOTP_KEY)
-            return totp.now()
+            if self._totp is None:
+                self._totp = pyotp.TOTP(settings.TOTP_KEY)
+                
+            ctr = int(time.time()) // self._totp.interval
+            if ctr != self._totp_ctr:
+                self._totp_val = self._totp.generate_otp(ctr)
+                self._totp_ctr = ctr
+            return self._totp_val
         except Exception as e:
             log_exception(e)
             return None
     
+    def _throttle(self, tokens=1):
+        """
+        Block until a broker request is allowed by both the per-second
+        and per-minute rate limits, then consume tokens from each.
+        Sleeps only as long as the buckets need to refill.
+        
+        Args:
+            tokens (int): Number of requests about to be made
+        """
+        with self._rate_lock:
+            wait = max(self._sec_bucket.expected_time(tokens), self._min_bucket.expected_time(tokens))
+            while wait > 0:
+                now = time.monotonic()
+                if now - self._last_wait_log >= self._wait_log_interval:
+                    logger.info(f"Broker rate limit reached, waiting {wait * 1000:.1f} ms")
+                    self._last_wait_log = now
+                time.sleep(wait)
+                wait = max(self._sec_bucket.expected_time(tokens), self._min_bucket.expected_time(tokens))
+            self._sec_bucket.can_consume(tokens)
+            self._min_bucket.can_consume(tokens)
+    
+    @staticmethod
+    def _retry(fn, *, retries=3, base=0.1, cap=5.0):
+        """
+        Call a function until it returns a truthy result, sleeping between
+        attempts with decorrelated jitter backoff.
+        
+        Args:
+            fn (callable): Function to call without arguments
+            retries (int): Maximum number of attempts
+            base (float): Minimum sleep between attempts in seconds
+            cap (float): Maximum sleep between attempts in seconds
+            
+        Returns:
+            The first truthy result returned by fn
+            
+        Raises:
+            Exception: The last exception raised by fn, or RuntimeError if
+                every attempt returned a falsy result
+        """
+        sleep = base
+        last_error = None
+        for attempt in range(retries):
+            try:
+                result = fn()
+                if result:
+                    return result
+            except Exception as e:
+                last_error = e
+                logger.warning(f"Broker request failed (attempt {attempt + 1}/{retries}): {e}")
+                
+            if attempt < retries - 1:
+                time.sleep(sleep)
+                sleep = min(cap, random.uniform(base, sleep * 3))
+                
+        raise last_error or RuntimeError(f"Broker request failed after {retries} attempts")
+        
     def connect(self):
         """
         Connect to Angel One broker using SmartAPI.
@@ -59,44 +145,51 @@ class AngelOneBroker:
             bool: True if connected successfully, False otherwise
         """
         try:
-            if self.api is None:
-                logger.info("Initializing SmartAPI connection...")
-                totp = self.generate_totp()
-                if not totp:
-                    logger.error("Failed to generate TOTP for authentication")
-                    return False
-
-                self.api = SmartConnect(api_key=settings.API_KEY)
-                data = self.api.generateSession(settings.USERNAME, settings.PASSWORD, totp)
-
-                if data and data.get('status'):
-                    self.refresh_token = data.get('data', {}).get('refreshToken')
-                    self.feed_token = self.api.getfeedToken()
-                    self.is_connected = True
-                    logger.info(f"Successfully connected to broker. Feed token: {self.feed_token}")
-                    return True
-                else:
-                    error_message = data.get('message', 'Unknown error') if data else 'No response from broker'
-                    logger.error(f"Failed to connect to broker: {error_message}")
-                    return False
-            else:
+            if self.api is not None:
                 try:
                     profile = self.api.getProfile()
                     if profile and profile.get('status'):
                         logger.info("Broker connection is active")
                         return True
-                    else:
-                        logger.warning("Broker session expired, reconnecting...")
-                        self.api = None
-                        return self.connect()
+                    logger.warning("Broker session expired, reconnecting...")
                 except Exception as e:
                     logger.warning(f"Error checking broker connection: {e}. Reconnecting...")
-                    self.api = None
-                    return self.connect()
+                self.api = None
+                
+            return self._retry(self._login)
         except Exception as e:
             log_exception(e)
             return False
             
+    def _login(self):
+        """
+        Create a new SmartAPI session.
+        
+        Returns:
+            bool: True if the session was created, False otherwise
+        """
+        logger.info("Initializing SmartAPI connection...")
+        totp = self.generate_totp()
+        if not totp:
+            logger.error("Failed to generate TOTP for authentication")
+            return False
+
+        # A pooled session keeps TLS connections alive between requests
+        self.api = SmartConnect(api_key=settings.API_KEY, pool=settings.HTTP_POOL)
+        data = self.api.generateSession(settings.USERNAME, settings.PASSWORD, totp)
+
+        if data and data.get('status'):
+            self.refresh_token = data.get('data', {}).get('refreshToken')
+            self.feed_token = self.api.getfeedToken()
+            self.is_connected = True
+            logger.info(f"Successfully connected to broker. Feed token: {self.feed_token}")
+            return True
+            
+        error_message = data.get('message', 'Unknown error') if data else 'No response from broker'
+        logger.error(f"Failed to connect to broker: {error_message}")
+        self.api = None
+        return False
+            
     def place_order(self, order_params, order_type="NORMAL"):
         """
         Place an order with the broker.
@@ -113,39 +206,13 @@ class AngelOneBroker:
                 logger.error("Failed to connect to broker for placing order")
                 return None
                 
-            # Rate limit handling
-            current_time = time.time()
-            
-            # Check minute-based rate limit
-            if current_time - self._minute_start_time >= 60:
-                # Reset minute counter if a minute has passed
-                self._minute_order_count = 0
-                self._minute_start_time = current_time
-            elif self._minute_order_count >= settings.MAX_REQUESTS_PER_MINUTE:
-                # Wait for the remainder of the minute if we've hit the limit
-                sleep_time = 60 - (current_time - self._minute_start_time)
-                if sleep_time > 0:
-                    logger.info(f"Reached minute order rate limit, waiting {sleep_time:.2f} seconds")
-                    time.sleep(sleep_time)
-                    self._minute_order_count = 0
-                    self._minute_start_time = time.time()
-
-            # Per-second rate limit
-            time_since_last = current_time - self._last_order_time
-            min_interval_sec = settings.MIN_REQUEST_INTERVAL_MS / 1000
-            if time_since_last < min_interval_sec:  
-                time.sleep(min_interval_sec - time_since_last)
-                
             # Set the order variety
             if 'variety' not in order_params:
                 order_params['variety'] = order_type
                 
             # Place the order
+            self._throttle()
             order_response = self.api.placeOrder(order_params)
-            
-            # Update rate limit tracking
-            self._last_order_time = time.time()
-            self._minute_order_count += 1
 
             # Process response
             order_id = None
@@ -156,6 +223,8 @@ class AngelOneBroker:
                 
             if order_id:
                 logger.info(f"Order placed successfully with ID: {order_id}")
+                # The cached order book does not contain the new order yet
+                self._orderbook_cache = (float('-inf'), {})
                 return order_id
             else:
                 logger.error(f"Order placement failed: {order_response}")
@@ -165,6 +234,50 @@ class AngelOneBroker:
             log_exception(e)
             return None
             
+    def _get_order_index(self, max_retries=3):
+        """
+        Get the order book indexed by order ID.
+        The index is reused for a short window so that sibling status
+        checks share a single orderBook request.
+        
+        Args:
+            max_retries (int): Maximum number of retry attempts
+            
+        Returns:
+            dict: Mapping of order ID to order data or None if failed
+        """
+        fetched_at, order_index = self._orderbook_cache
+        if time.monotonic() - fetched_at < self._orderbook_ttl:
+            return order_index
+            
+        def request():
+            self._throttle()
+            order_book = self.api.orderBook()
+            return order_book if order_book and 'data' in order_book else None
+            
+        try:
+            order_book = self._retry(request, retries=max_retries)
+        except Exception as e:
+            log_exception(e)
+            return None
+            
+        order_index = {order.get('orderid'): order for order in order_book['data'] or []}
+        self._orderbook_cache = (time.monotonic(), order_index)
+        return order_index
+        
+    @staticmethod
+    def _format_order_status(order_id, order):
+        """Build the order status dictionary from an order book entry."""
+        return {
+            'order_id': order_id,
+            'status': order.get('status'),
+            'filled_quantity': order.get('filledqty'),
+            'average_price': order.get('averageprice'),
+            'order_type': order.get('ordertype'),
+            'product_type': order.get('producttype'),
+            'variety': order.get('variety')
+        }
+        
     def check_order_status(self, order_id, max_retries=3):
         """
         Check the status of a placed order.
@@ -179,57 +292,33 @@ class AngelOneBroker:
         if not order_id:
             return None
             
-        current_time = time.time()
+        order_index = self._get_order_index(max_retries)
+        if not order_index:
+            return None
+            
+        order = order_index.get(order_id)
+        if order is None:
+            return None
+        return self._format_order_status(order_id, order)
+        
+    def check_order_statuses(self, order_ids, max_retries=3):
+        """
+        Check the status of several placed orders with a single order book fetch.
+        
+        Args:
+            order_ids (list): Order IDs to check
+            max_retries (int): Maximum number of retry attempts
+            
+        Returns:
+            dict: Mapping of order ID to status information (None if not found)
+        """
+        order_index = self._get_order_index(max_retries) or {}
         
-        if current_time - self._minute_status_start >= 60:
-            self._minute_status_count = 0
-            self._minute_status_start = current_time
-        elif self._minute_status_count >= settings.MAX_REQUESTS_PER_MINUTE:
-            sleep_time = 60 - (current_time - self._minute_status_start)
-            if sleep_time > 0:
-                logger.info(f"Reached minute status check rate limit, waiting {sleep_time:.2f} seconds")
-                time.sleep(sleep_time)
-                self._minute_status_count = 0
-                self._minute_status_start = time.time()
-                
-        for retry in range(max_retries):
-            try:
-                time_since_last = current_time - self._last_status_check
-                min_interval_sec = settings.MIN_REQUEST_INTERVAL_MS / 1000
-                if time_since_last < min_interval_sec:
-                    time.sleep(min_interval_sec - time_since_last)
-
-                order_book = self.api.orderBook()
-                
-                self._last_status_check = time.time()
-                self._minute_status_count += 1
-
-                if order_book and 'data' in order_book:
-                    for order in order_book['data']:
-                        if order.get('orderid') == order_id:
-                            return {
-                                'order_id': order_id,
-                                'status': order.get('status'),
-                                'filled_quantity': order.get('filledqty'),
-                                'average_price': order.get('averageprice'),
-                                'order_type': order.get('ordertype'),
-                                'product_type': order.get('producttype'),
-                                'variety': order.get('variety')
-                            }
-                    return None
-                    
-                if retry < max_retries - 1:
-                    time.sleep(0.5)  
-                    continue
-                    
-            except Exception as e:
-                log_exception(e)
-                if retry < max_retries - 1:
-                    time.sleep(0.5)
-                    continue
-                break
-                
-        return None
+        statuses = {}
+        for order_id in order_ids:
+            order = order_index.get(order_id)
+            statuses[order_id] = self._format_order_status(order_id, order) if order is not None else None
+        return statuses
         
     def get_option_greeks(self, name, expiry_date, max_retries=3):
         """
@@ -247,38 +336,122 @@ class AngelOneBroker:
             logger.error("Failed to connect to broker for getting option Greeks")
             return None
             
+        return self._fetch_option_greeks(name, expiry_date, max_retries)
+        
+    async def get_option_greeks_many(self, pairs, max_retries=3):
+        """
+        Get option Greek values for several instruments/expiries concurrently.
+        Requests still go through the shared rate limiter, so they overlap
+        network round-trips without exceeding the broker limits.
+        
+        Args:
+            pairs (list): List of (name, expiry_date) tuples
+            max_retries (int): Maximum number of retry attempts per request
+            
+        Returns:
+            dict: Mapping of (name, expiry_date) to option Greek data (None if failed)
+        """
+        pairs = list(pairs)
+        if not await asyncio.to_thread(self.connect):
+            logger.error("Failed to connect to broker for getting option Greeks")
+            return {pair: None for pair in pairs}
+            
+        semaphore = asyncio.Semaphore(self._max_per_sec)
+        
+        async def fetch(name, expiry_date):
+            async with semaphore:
+                return await asyncio.to_thread(self._fetch_option_greeks, name, expiry_date, max_retries)
+                
+        results = await asyncio.gather(*(fetch(name, expiry_date) for name, expiry_date in pairs))
+        return dict(zip(pairs, results))
+        
+    def _fetch_option_greeks(self, name, expiry_date, max_retries=3):
+        """
+        Request option Greeks from the broker with retries.
+        Assumes the broker session is already connected.
+        
+        Args:
+            name (str): Instrument name (e.g., "NIFTY")
+            expiry_date (str): Expiry date in format DDMMMYYYY (e.g., "29JUN2023")
+            max_retries (int): Maximum number of retry attempts
+            
+        Returns:
+            list: Option Greek data or None if failed
+        """
         greek_param = {
             "name": name,
             "expirydate": expiry_date
         }
         
-        for retry in range(max_retries):
+        def request():
+            self._throttle()
+            greek_res = self.api.optionGreek(greek_param)
+            if greek_res and greek_res.get('status'):
+                return greek_res
+            error_msg = greek_res.get('message', 'Unknown error') if greek_res else 'No response from broker'
+            logger.warning(f"Option Greeks API error: {error_msg}")
+            return None
+            
+        try:
+            return self._retry(request, retries=max_retries).get('data', [])
+        except Exception as e:
+            log_exception(e)
+            return None
+        
+    @staticmethod
+    def _tune_websocket_thread():
+        """
+        Pin the calling websocket thread to its dedicated core and raise
+        its scheduling priority. Failures are logged and ignored since
+        both need OS support and suitable privileges.
+        """
+        if settings.WS_CORE is not None:
             try:
+                os.sched_setaffinity(0, {settings.WS_CORE})
+            except (AttributeError, OSError, ValueError) as e:
+                logger.warning(f"Could not pin websocket thread to core {settings.WS_CORE}: {e}")
                 
-                if retry > 0:
-                    jitter = random.uniform(0, 0.1)
-                    backoff = min(2 ** retry + jitter, 5)  
-                    time.sleep(backoff)
-                
-                greek_res = self.api.optionGreek(greek_param)
-                
-                if greek_res and greek_res.get('status'):
-                    return greek_res.get('data', [])
-                else:
-                    error_msg = greek_res.get('message', 'Unknown error')
-                    logger.warning(f"Option Greeks API error: {error_msg}")
-                    
-                   
-                    if any(phrase in str(error_msg).lower() for phrase in 
-                          ['rate limit', 'too many requests', 'exceeding access']):
-                       
-                        time.sleep(min(5 * (retry + 1), 30))
-                        
-            except Exception as e:
-                log_exception(e)
+        if settings.WS_NICE:
+            try:
+                os.nice(settings.WS_NICE)
+            except (AttributeError, OSError) as e:
+                logger.warning(f"Could not change websocket thread priority: {e}")
                 
-        return None
+    @staticmethod
+    def _tune_websocket_socket(wsapp):
+        """
+        Disable Nagle's algorithm and enlarge the receive buffer on the
+        websocket's underlying TCP socket. When WS_BUSY_POLL is set, the
+        kernel also spins on the device queue during reads instead of
+        sleeping until the next packet wakes the reader thread.
         
+        Args:
+            wsapp: websocket-client application owning the connection
+        """
+        sock = getattr(getattr(wsapp, 'sock', None), 'sock', None)
+        if sock is None:
+            return
+            
+        try:
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, settings.WS_RCVBUF_BYTES)
+        except OSError as e:
+            logger.warning(f"Could not tune websocket socket options: {e}")
+            
+        if settings.WS_BUSY_POLL:
+            # SO_BUSY_POLL is Linux only and not exported by every Python
+            # build; 46 is its number on Linux, but may mean another option
+            # elsewhere
+            busy_poll = getattr(socket, 'SO_BUSY_POLL', 46 if sys.platform.startswith('linux') else None)
+            if busy_poll is None:
+                logger.warning("Websocket busy polling is not available on this platform")
+                return
+                
+            try:
+                sock.setsockopt(socket.SOL_SOCKET, busy_poll, settings.WS_BUSY_POLL_USEC)
+            except OSError as e:
+                logger.warning(f"Could not enable websocket busy polling: {e}")
+            
     def start_websocket(self, token_list, on_data_callback):
         """
         Start a websocket connection for real-time data.
@@ -306,11 +479,17 @@ class AngelOneBroker:
             
             def on_open(wsapp):
                 logger.info("WebSocket connection opened")
+                self._tune_websocket_socket(wsapp)
                 correlation_id = "nifty_data_tracker"
                 mode = 1  
                 ws.subscribe(correlation_id, mode, token_list)
                 
             def on_data_wrapper(wsapp, message):
+                if isinstance(message, (bytes, str)):
+                    try:
+                        message = orjson.loads(message)
+                    except orjson.JSONDecodeError:
+                        pass
                 on_data_callback(message)
                 
             def on_error(wsapp, error):
@@ -327,6 +506,7 @@ class AngelOneBroker:
             
             
             def ws_connect_thread():
+                self._tune_websocket_thread()
                 ws.connect()
                 
             thread = threading.Thread(target=ws_connect_thread, daemon=True)
@@ -20,12 +20,16 @@ DATA_DIR = os.path.join(BASE_DIR, 'data')
 ORDER_HISTORY_DIR = os.path.join(DATA_DIR, 'order_history')
 OPTIONS_DATA_DIR = os.path.join(DATA_DIR, 'options_data')
 RAW_TICKS_DIR = os.path.join(DATA_DIR, 'raw_ticks')
+HIST_CACHE_DIR = os.path.join(DATA_DIR, 'hist_cache')
+SCRIPMASTER_JSON_CACHE = os.path.join(DATA_DIR, 'scripmaster.json')
+NIFTY_OPTIONS_PARQUET = os.path.join(OPTIONS_DATA_DIR, 'nifty_options.parquet')
 
 
 os.makedirs(DATA_DIR, exist_ok=True)
 os.makedirs(ORDER_HISTORY_DIR, exist_ok=True)
 os.makedirs(OPTIONS_DATA_DIR, exist_ok=True)
 os.makedirs(RAW_TICKS_DIR, exist_ok=True)
+os.makedirs(HIST_CACHE_DIR, exist_ok=True)
 
 
 DEFAULT_LOT_SIZE = 75
@@ -37,7 +41,26 @@ MAX_SIGNAL_ATTEMPTS = 1
 
 MAX_REQUESTS_PER_MINUTE = 500
 MAX_REQUESTS_PER_SECOND = 20
-MIN_REQUEST_INTERVAL_MS = 50  
+RATE_LIMIT_LOG_INTERVAL = 5  
+ORDER_BOOK_CACHE_TTL = 0.25  
+HIST_CACHE_SIZE = 32
+SCRIPMASTER_TIMEOUT = 30  
+HTTP_POOL = {
+    'pool_connections': 8,
+    'pool_maxsize': 32,
+    'max_retries': 0
+}
+
+
+WS_CORE = 3  
+WS_NICE = -5
+WS_RCVBUF_BYTES = 4 * 1024 * 1024
+WS_BUSY_POLL = False  
+WS_BUSY_POLL_USEC = 50
+TICK_QUEUE_SIZE = 8192
+TICK_BATCH_SIZE = 64
+TICK_COALESCE_MS = 1  
+TICK_BUFFER_SIZE = 1 << 16
 
 
 GREEKS_REFRESH_INTERVAL = 10  
@@ -3,11 +3,76 @@ OHLCV (Open, High, Low, Close, Volume) data module.
 Provides classes and functions for working with time series price data.
 """
 import os
+import hashlib
+import threading
+from collections import OrderedDict
+import numpy as np
 import pandas as pd
-from datetime import datetime
+from datetime import datetime, timedelta
 from ..utils.logger import logger
+from ..utils.jit import njit
 from ..config import settings
 
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pq = None
+
+_EPOCH = datetime(1970, 1, 1)
+_ONE_US = timedelta(microseconds=1)
+_NS_PER_DAY = 24 * 60 * 60 * 10**9
+
+_ARROW_SCHEMA = pa.schema([
+    ('timestamp', pa.timestamp('ns')),
+    ('open', pa.float64()),
+    ('high', pa.float64()),
+    ('low', pa.float64()),
+    ('close', pa.float64()),
+    ('volume', pa.float64())
+]) if pa is not None else None
+
+# In-process cache of historical data for closed periods, most recent last
+_history_cache = OrderedDict()
+_history_cache_lock = threading.Lock()
+
+@njit(cache=True, fastmath=True)
+def _apply_tick(t, o, h, l, c, v, n, ts_ns, price, tf_ns, cur_bucket):
+    """
+    Apply one tick to the candle arrays.
+    The arrays must have room for at least n + 1 candles.
+    
+    Args:
+        t (np.ndarray): Candle start times as int64 nanoseconds
+        o, h, l, c, v (np.ndarray): Open, high, low, close and volume columns
+        n (int): Number of candles currently stored
+        ts_ns (int): Tick time as nanoseconds since the epoch
+        price (float): Traded price
+        tf_ns (int): Timeframe length in nanoseconds
+        cur_bucket (int): Bucket index of the current candle
+        
+    Returns:
+        tuple: (candle count, current bucket index) after the update
+    """
+    bucket = ts_ns // tf_ns
+    if bucket > cur_bucket:
+        t[n] = bucket * tf_ns
+        o[n] = price
+        h[n] = price
+        l[n] = price
+        c[n] = price
+        v[n] = 0.0
+        return n + 1, bucket
+        
+    i = n - 1
+    if price > h[i]:
+        h[i] = price
+    elif price < l[i]:
+        l[i] = price
+    c[i] = price
+    return n, cur_bucket
+
 class LiveOHLCVData:
     """
     Class for managing real-time OHLCV data with multiple timeframes.
@@ -24,8 +89,52 @@ class LiveOHLCVData:
         """
         self.timeframe_minutes = timeframe_minutes
         self.name = name
-        self.current_candle = None
-        self.completed_candles = []
+        
+        # Ticks are bucketed by integer division of their wall-clock offset
+        self._tf_sec = timeframe_minutes * 60
+        self._tf_delta = timedelta(seconds=self._tf_sec)
+        self._tf_ns = self._tf_sec * 1_000_000_000
+        self._cur_bucket = -1
+        
+        # Candles are stored column-wise in preallocated arrays; the last
+        # row is updated in place while its bucket is still current
+        self._cap = 1024
+        self._n = 0
+        self._t = np.empty(self._cap, dtype='datetime64[ns]')
+        self._o = np.empty(self._cap, dtype=np.float64)
+        self._h = np.empty(self._cap, dtype=np.float64)
+        self._l = np.empty(self._cap, dtype=np.float64)
+        self._c = np.empty(self._cap, dtype=np.float64)
+        self._v = np.empty(self._cap, dtype=np.float64)
+        
+        # Bumped on every change so get_dataframe can reuse its last frame
+        self._version = 0
+        self._cached_df = None
+        self._cached_df_key = None
+        
+        # Parquet export appends candles not yet written to an open file
+        self._writer = None
+        self._export_path = None
+        self._exported_n = 0
+        
+    def _grow(self, min_capacity):
+        """
+        Grow the candle arrays to hold at least the given number of candles.
+        
+        Args:
+            min_capacity (int): Required capacity
+        """
+        cap = self._cap
+        while cap < min_capacity:
+            cap *= 2
+        if cap == self._cap:
+            return
+        for attr in ('_t', '_o', '_h', '_l', '_c', '_v'):
+            old = getattr(self, attr)
+            new = np.empty(cap, dtype=old.dtype)
+            new[:self._n] = old[:self._n]
+            setattr(self, attr, new)
+        self._cap = cap
         
     def update_from_tick(self, tick):
         """
@@ -33,38 +142,42 @@ class LiveOHLCVData:
         
         Args:
             tick (dict): Tick data with timestamp and ltp (last traded price)
+            
+        Returns:
+            bool: True if the tick started a new candle, False otherwise
         """
         try:
-            tick_time = tick['timestamp']
-            price = tick['ltp']
+            ts_ns = (tick['timestamp'] - _EPOCH) // _ONE_US * 1000
+            return self.update_from_ns(ts_ns, float(tick['ltp']))
+        except Exception as e:
+            logger.error(f"Error updating candle from tick: {e}")
+            return False
             
-           
-            candle_start = tick_time.replace(
-                minute=(tick_time.minute // self.timeframe_minutes) * self.timeframe_minutes,
-                second=0,
-                microsecond=0
-            )
+    def update_from_ns(self, ts_ns, price):
+        """
+        Update candle data from a tick time already converted to nanoseconds.
+        
+        Args:
+            ts_ns (int): Tick time as wall-clock nanoseconds since the epoch
+            price (float): Last traded price
             
-          
-            if not self.current_candle or candle_start > self.current_candle['time']:
-                if self.current_candle:
-                    self.completed_candles.append(self.current_candle)
-                self.current_candle = {
-                    'time': candle_start,
-                    'open': price,
-                    'high': price,
-                    'low': price,
-                    'close': price,
-                    'volume': 0
-                }
-            else:
-               
-                self.current_candle['high'] = max(self.current_candle['high'], price)
-                self.current_candle['low'] = min(self.current_candle['low'], price)
-                self.current_candle['close'] = price
+        Returns:
+            bool: True if the tick started a new candle, False otherwise
+        """
+        try:
+            n = self._n
+            if n == self._cap:
+                self._grow(n + 1)
+            self._n, self._cur_bucket = _apply_tick(
+                self._t.view(np.int64), self._o, self._h, self._l, self._c, self._v,
+                n, ts_ns, price, self._tf_ns, self._cur_bucket
+            )
+            self._version += 1
+            return self._n != n
                 
         except Exception as e:
             logger.error(f"Error updating candle from tick: {e}")
+            return False
     
     def get_latest_candles(self, count=100):
         """
@@ -76,63 +189,184 @@ class LiveOHLCVData:
         Returns:
             list: List of candle dictionaries
         """
-        all_candles = self.completed_candles + [self.current_candle] if self.current_candle else self.completed_candles
-        return all_candles[-count:]
+        end = self._n
+        start = max(end - count, 0)
+        return [
+            {'time': pd.Timestamp(t), 'open': o, 'high': h, 'low': l, 'close': c, 'volume': v}
+            for t, o, h, l, c, v in zip(
+                self._t[start:end],
+                self._o[start:end].tolist(),
+                self._h[start:end].tolist(),
+                self._l[start:end].tolist(),
+                self._c[start:end].tolist(),
+                self._v[start:end].tolist()
+            )
+        ]
     
-    def get_dataframe(self):
+    def get_dataframe(self, count=100):
         """
         Convert candle data to pandas DataFrame.
+        The frame is cached until the candles change, so callers share it
+        and must not modify it in place.
         
+        Args:
+            count (int): Maximum number of candles to include
+            
         Returns:
             pd.DataFrame: DataFrame with OHLCV data
         """
-        candles = self.get_latest_candles()
-        if not candles:
+        key = (self._version, count)
+        if self._cached_df_key == key:
+            return self._cached_df
+            
+        n = self._n
+        if n == 0:
             return pd.DataFrame()
         
-        df = pd.DataFrame(candles)
-        if 'time' in df.columns:
-            df = df.rename(columns={'time': 'timestamp'})
-            df.set_index('timestamp', inplace=True)
-        
+        start = max(n - count, 0)
+        df = pd.DataFrame(
+            {
+                'open': self._o[start:n],
+                'high': self._h[start:n],
+                'low': self._l[start:n],
+                'close': self._c[start:n],
+                'volume': self._v[start:n]
+            },
+            index=pd.DatetimeIndex(self._t[start:n], name='timestamp')
+        )
+        self._cached_df = df
+        self._cached_df_key = key
         return df
     
-    def initialize_from_historical(self, historical_df):
+    def initialize_from_historical(self, historical_df, already_aggregated=False):
         """
         Initialize candle data from historical DataFrame.
         
         Args:
-            historical_df (pd.DataFrame): Historical data with OHLCV columns
+            historical_df (pd.DataFrame): Historical data with OHLCV columns and
+                either a 'timestamp' column or a DatetimeIndex
+            already_aggregated (bool): True if the rows are already candles of
+                this timeframe, False to resample them first
             
         Returns:
             bool: True if successful, False otherwise
         """
         try:
+            if not already_aggregated and self.timeframe_minutes > 1:
+                historical_df = resample_ohlcv(historical_df, f"{self.timeframe_minutes}min")
+                
             if historical_df.empty:
                 logger.warning(f"Empty historical data provided, not initializing {self.timeframe_minutes}min candles")
                 return False
                 
-            # Make sure we have a copy to avoid modifying the original
-            sorted_df = historical_df.sort_values('timestamp')
+            if 'timestamp' in historical_df.columns:
+                sorted_df = historical_df.sort_values('timestamp')
+                timestamps = pd.DatetimeIndex(sorted_df['timestamp'])
+            else:
+                sorted_df = historical_df.sort_index()
+                timestamps = pd.DatetimeIndex(sorted_df.index)
+            if timestamps.tz is not None:
+                timestamps = timestamps.tz_localize(None)
+            volume = sorted_df['volume'].to_numpy(dtype=np.float64) if 'volume' in sorted_df.columns else 0.0
             
-            # Convert each row to a candle dictionary
-            for _, row in sorted_df.iterrows():
-                candle = {
-                    'time': row['timestamp'],
-                    'open': row['open'],
-                    'high': row['high'],
-                    'low': row['low'],
-                    'close': row['close'],
-                    'volume': row['volume'] if 'volume' in row else 0
-                }
-                self.completed_candles.append(candle)
+            # Bulk copy the columns into the candle arrays
+            start = self._n
+            end = start + len(sorted_df)
+            self._grow(end)
+            self._t[start:end] = timestamps.to_numpy(dtype='datetime64[ns]')
+            self._o[start:end] = sorted_df['open'].to_numpy(dtype=np.float64)
+            self._h[start:end] = sorted_df['high'].to_numpy(dtype=np.float64)
+            self._l[start:end] = sorted_df['low'].to_numpy(dtype=np.float64)
+            self._c[start:end] = sorted_df['close'].to_numpy(dtype=np.float64)
+            self._v[start:end] = volume
+            self._n = end
+            self._version += 1
+            
+            # Live ticks in the last historical bucket update that candle
+            self._cur_bucket = int(self._t[end - 1].astype(np.int64)) // self._tf_ns
                 
-            logger.info(f"Initialized {len(self.completed_candles)} historical {self.timeframe_minutes}min candles for {self.name}")
+            logger.info(f"Initialized {self._n} historical {self.timeframe_minutes}min candles for {self.name}")
             return True
         except Exception as e:
             logger.error(f"Error initializing from historical data: {e}")
             return False
     
+    def export(self, filename_prefix=None):
+        """
+        Export completed candles to a Parquet file.
+        The file is opened on the first export and each later call appends
+        only the candles completed since the previous one. Falls back to a
+        CSV snapshot when pyarrow is not installed.
+        
+        Args:
+            filename_prefix (str, optional): Prefix for the filename
+            
+        Returns:
+            str: Path to the export file or None if failed
+        """
+        if pq is None:
+            return self.export_to_csv(filename_prefix)
+            
+        # The last candle is still being updated by ticks
+        return self._write_parquet(self._n - 1, filename_prefix)
+        
+    def close(self):
+        """Write all remaining candles, including the current one, and close the export file."""
+        if pq is None:
+            return
+            
+        self._write_parquet(self._n)
+        if self._writer is not None:
+            try:
+                self._writer.close()
+                logger.info(f"Closed candle export file {self._export_path}")
+            except Exception as e:
+                logger.error(f"Error closing candle export file: {e}")
+            self._writer = None
+            
+    def _write_parquet(self, end, filename_prefix=None):
+        """
+        Append candles from the last exported row up to `end` to the Parquet file.
+        
+        Args:
+            end (int): Row index to export up to (exclusive)
+            filename_prefix (str, optional): Prefix for the filename
+            
+        Returns:
+            str: Path to the export file or None if failed
+        """
+        try:
+            start = self._exported_n
+            if end <= start:
+                return self._export_path
+                
+            if self._writer is None:
+                os.makedirs(settings.DATA_DIR, exist_ok=True)
+                timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+                prefix = filename_prefix or f"{self.name}_{self.timeframe_minutes}min"
+                self._export_path = os.path.join(settings.DATA_DIR, f"{prefix}_{timestamp}.parquet")
+                self._writer = pq.ParquetWriter(self._export_path, _ARROW_SCHEMA, compression='zstd')
+                
+            table = pa.Table.from_arrays(
+                [
+                    pa.array(self._t[start:end]),
+                    pa.array(self._o[start:end]),
+                    pa.array(self._h[start:end]),
+                    pa.array(self._l[start:end]),
+                    pa.array(self._c[start:end]),
+                    pa.array(self._v[start:end])
+                ],
+                schema=_ARROW_SCHEMA
+            )
+            self._writer.write_table(table)
+            self._exported_n = end
+            
+            logger.info(f"Appended {end - start} candles to {self._export_path}")
+            return self._export_path
+        except Exception as e:
+            logger.error(f"Error exporting data to Parquet: {e}")
+            return None
+    
     def export_to_csv(self, filename_prefix=None):
         """
         Export candle data to CSV file.
@@ -164,6 +398,21 @@ class LiveOHLCVData:
             logger.error(f"Error exporting data to CSV: {e}")
             return None
 
+def update_from_tick_multi(views, ts_ns, price):
+    """
+    Update several candle series from one tick.
+    The tick time is converted once by the caller and shared by all views.
+    
+    Args:
+        views (tuple): LiveOHLCVData instances to update
+        ts_ns (int): Tick time as wall-clock nanoseconds since the epoch
+        price (float): Last traded price
+        
+    Returns:
+        tuple: For each view, True if the tick started a new candle
+    """
+    return tuple(view.update_from_ns(ts_ns, price) for view in views)
+
 def resample_ohlcv(df, timeframe, on='timestamp'):
     """
     Resample OHLCV data to a different timeframe.
@@ -171,29 +420,61 @@ def resample_ohlcv(df, timeframe, on='timestamp'):
     Args:
         df (pd.DataFrame): DataFrame containing OHLCV data
         timeframe (str): Pandas-compatible timeframe string (e.g., '5min', '1H')
-        on (str): Column to use as timestamp
+        on (str): Column to use as timestamp when the index is not a DatetimeIndex
         
     Returns:
-        pd.DataFrame: Resampled DataFrame
+        pd.DataFrame: Resampled DataFrame. For empty input the input frame
+            itself is returned, so callers must not mutate it in place.
     """
     try:
         if df.empty:
             return df
             
-        temp_df = df.copy()
-        if on in temp_df.columns and not pd.api.types.is_datetime64_any_dtype(temp_df[on]):
-            temp_df[on] = pd.to_datetime(temp_df[on])
+        # Use datetime-indexed input as-is; only build a new index when needed
+        if isinstance(df.index, pd.DatetimeIndex):
+            temp_df = df
+        else:
+            temp_df = df.set_index(pd.DatetimeIndex(pd.to_datetime(df[on]), name=on))
+            
+        try:
+            bar_ns = pd.Timedelta(timeframe).value
+        except ValueError:
+            bar_ns = 0
+            
+        # Calendar-based frequencies (e.g. months, weeks) and bars that do not
+        # divide a day are anchored by pandas, so use its resampler for them
+        if bar_ns <= 0 or _NS_PER_DAY % bar_ns:
+            return temp_df.resample(timeframe).agg({
+                'open': 'first',
+                'high': 'max',
+                'low': 'min',
+                'close': 'last',
+                'volume': 'sum'
+            }).dropna()
+            
+        if not temp_df.index.is_monotonic_increasing:
+            temp_df = temp_df.sort_index()
             
-        if temp_df.index.name != on and on in temp_df.columns:
-            temp_df = temp_df.set_index(on)
+        # Bucket on wall-clock nanoseconds so bars align like pandas' resample;
+        # the index may be stored in another unit (pandas 3 defaults to us)
+        index = temp_df.index
+        wall_index = index.tz_localize(None) if index.tz is not None else index
+        buckets = wall_index.as_unit('ns').asi8 // bar_ns
+        starts = np.flatnonzero(np.r_[True, buckets[1:] != buckets[:-1]])
+        ends = np.r_[starts[1:], len(buckets)] - 1
+        
+        bar_ns_values = (buckets[starts] * bar_ns).astype('datetime64[ns]')
+        bar_index = pd.DatetimeIndex(bar_ns_values, name=index.name).as_unit(wall_index.unit)
+        if index.tz is not None:
+            bar_index = bar_index.tz_localize(index.tz)
             
-        resampled = temp_df.resample(timeframe).agg({
-            'open': 'first',
-            'high': 'max',
-            'low': 'min',
-            'close': 'last',
-            'volume': 'sum'
-        }).dropna()
+        resampled = pd.DataFrame({
+            'open': temp_df['open'].to_numpy(dtype=np.float64)[starts],
+            'high': np.fmax.reduceat(temp_df['high'].to_numpy(dtype=np.float64), starts),
+            'low': np.fmin.reduceat(temp_df['low'].to_numpy(dtype=np.float64), starts),
+            'close': temp_df['close'].to_numpy(dtype=np.float64)[ends],
+            'volume': np.add.reduceat(np.nan_to_num(temp_df['volume'].to_numpy(dtype=np.float64)), starts)
+        }, index=bar_index).dropna()
         
         return resampled
     except Exception as e:
@@ -203,6 +484,114 @@ def resample_ohlcv(df, timeframe, on='timestamp'):
 def fetch_historical_data(broker, token, exchange, from_date, to_date, interval="ONE_MINUTE"):
     """
     Fetch historical OHLCV data from the broker.
+    Ranges that end before the current trading day are served from an
+    in-process LRU cache backed by pickle files in HIST_CACHE_DIR.
+    
+    Args:
+        broker: Broker instance
+        token (str): Symbol token
+        exchange (str): Exchange identifier
+        from_date (str): Start date in format "YYYY-MM-DD HH:MM"
+        to_date (str): End date in format "YYYY-MM-DD HH:MM"
+        interval (str): Candle interval
+        
+    Returns:
+        pd.DataFrame: DataFrame with historical data
+    """
+    cache_key = (str(token), exchange, from_date, to_date, interval)
+    cacheable = _is_closed_period(to_date)
+    
+    if cacheable:
+        cached = _load_cached_history(cache_key)
+        if cached is not None:
+            logger.info(f"Using cached {interval} historical data for {exchange}:{token} from {from_date} to {to_date}")
+            return cached
+            
+    df = _request_historical_data(broker, token, exchange, from_date, to_date, interval)
+    
+    if cacheable and not df.empty:
+        _store_cached_history(cache_key, df)
+        
+    return df
+
+def _is_closed_period(to_date):
+    """
+    Check whether a historical range ends before the current trading day.
+    Bars for such ranges no longer change and are safe to cache.
+    
+    Args:
+        to_date (str): End date in format "YYYY-MM-DD HH:MM"
+        
+    Returns:
+        bool: True if the range is closed, False otherwise
+    """
+    try:
+        return pd.Timestamp(to_date) < pd.Timestamp.now().normalize()
+    except (ValueError, TypeError):
+        return False
+
+def _history_cache_path(cache_key):
+    """Get the on-disk cache file for a historical data request."""
+    token, _, _, _, interval = cache_key
+    digest = hashlib.sha1(repr(cache_key).encode()).hexdigest()[:16]
+    return os.path.join(settings.HIST_CACHE_DIR, f"{token}_{interval}_{digest}.pkl")
+
+def _load_cached_history(cache_key):
+    """
+    Load historical data from the in-process or on-disk cache.
+    
+    Args:
+        cache_key (tuple): (token, exchange, from_date, to_date, interval)
+        
+    Returns:
+        pd.DataFrame: Copy of the cached data or None if not cached
+    """
+    with _history_cache_lock:
+        df = _history_cache.get(cache_key)
+        if df is not None:
+            _history_cache.move_to_end(cache_key)
+            return df.copy()
+            
+    path = _history_cache_path(cache_key)
+    if not os.path.exists(path):
+        return None
+        
+    try:
+        df = pd.read_pickle(path)
+    except Exception as e:
+        logger.warning(f"Ignoring unreadable historical data cache {path}: {e}")
+        return None
+        
+    _remember_history(cache_key, df)
+    return df.copy()
+
+def _store_cached_history(cache_key, df):
+    """
+    Store historical data in the in-process and on-disk caches.
+    
+    Args:
+        cache_key (tuple): (token, exchange, from_date, to_date, interval)
+        df (pd.DataFrame): Historical data to cache
+    """
+    _remember_history(cache_key, df.copy())
+    
+    try:
+        os.makedirs(settings.HIST_CACHE_DIR, exist_ok=True)
+        df.to_pickle(_history_cache_path(cache_key))
+    except Exception as e:
+        logger.warning(f"Error writing historical data cache: {e}")
+
+def _remember_history(cache_key, df):
+    """Add a frame to the in-process cache, evicting the least recently used."""
+    with _history_cache_lock:
+        _history_cache[cache_key] = df
+        _history_cache.move_to_end(cache_key)
+        while len(_history_cache) > settings.HIST_CACHE_SIZE:
+            _history_cache.popitem(last=False)
+
+def _request_historical_data(broker, token, exchange, from_date, to_date, interval="ONE_MINUTE"):
+    """
+    Request historical OHLCV data from the broker, bypassing the cache.
     
     Args:
         broker: Broker instance
@@ -244,15 +633,25 @@ def fetch_historical_data(broker, token, exchange, from_date, to_date, interval=
                 return pd.DataFrame()
                 
             if data:
-                df = pd.DataFrame(data, columns=['timestamp', 'open', 'high', 'low', 'close', 'volume'])
                 try:
-                    df['timestamp'] = pd.to_datetime(df['timestamp'], errors='coerce')
+                    # Build typed columns in one pass over the response rows
+                    rows = np.array(data, dtype=object)
+                    try:
+                        values = rows[:, 1:6].astype(np.float64)
+                    except (TypeError, ValueError):
+                        values = np.column_stack([pd.to_numeric(rows[:, i], errors='coerce') for i in range(1, 6)])
+                        
+                    df = pd.DataFrame({
+                        'timestamp': pd.to_datetime(rows[:, 0], errors='coerce'),
+                        'open': values[:, 0],
+                        'high': values[:, 1],
+                        'low': values[:, 2],
+                        'close': values[:, 3],
+                        'volume': values[:, 4]
+                    })
                     df = df.dropna(subset=['timestamp'])
                     df = df.sort_values('timestamp')
                     
-                    numeric_cols = ['open', 'high', 'low', 'close', 'volume']
-                    df[numeric_cols] = df[numeric_cols].apply(pd.to_numeric, errors='coerce')
-                    
                     logger.info(f"Successfully fetched {len(df)} records")
                     return df
                 except Exception as e:
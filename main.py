@@ -2,17 +2,40 @@
 Main entry point for the AlgoTrading application.
 """
 import os
+import csv
 import time
+import queue
+import threading
+import orjson
+import numpy as np
 import pandas as pd
 from datetime import datetime, timedelta
 
 from .brokers.angelone import broker
 from .strategies.bullish_swing import BullishSwingStrategy
-from .data.ohlcv import LiveOHLCVData, fetch_historical_data
-from .utils.helpers import get_today_date_range, fetch_scripmaster_data, get_nearest_expiry_dates
+from .data.ohlcv import LiveOHLCVData, fetch_historical_data, resample_ohlcv, update_from_tick_multi
+from .utils.helpers import get_today_date_range, fetch_scripmaster_data, get_nearest_expiry_dates, parse_expiry_date
 from .utils.logger import logger
 from .config import settings
 
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pq = None
+
+_EPOCH = datetime(1970, 1, 1)
+_ONE_US = timedelta(microseconds=1)
+
+# Price and size columns buffered per tick, in export order after the timestamp
+TICK_COLUMNS = ('ltp', 'last_traded_quantity', 'volume', 'open', 'high', 'low', 'close')
+_PRICE_ROWS = [0, 3, 4, 5, 6]
+
+_TICK_SCHEMA = pa.schema(
+    [('timestamp', pa.timestamp('ns'))] + [(name, pa.float64()) for name in TICK_COLUMNS]
+) if pa is not None else None
+
 class AlgoTradingApp:
     """Main application class for AlgoTrading."""
     
@@ -20,23 +43,41 @@ class AlgoTradingApp:
         """Initialize the application."""
         self.broker = broker
         self.spot_token = settings.SPOT_TOKEN
+        self._spot_token_i = int(settings.SPOT_TOKEN)
         self.fut_token = None
+        self._scrip_df = None
         
         
         self.spot_1min = LiveOHLCVData(timeframe_minutes=1, name="spot")
         self.spot_5min = LiveOHLCVData(timeframe_minutes=5, name="spot")
         self.spot_15min = LiveOHLCVData(timeframe_minutes=15, name="spot")
+        self._views = (self.spot_1min, self.spot_5min, self.spot_15min)
         
       
         self.spot_strategy = None
+        self._last_signal_ts = None
         
       
         self.websocket = None
         
        
-        self.spot_ticks = []
         self.spot_ltp = 0
         self.tick_count = 0
+        self.last_export_time = time.monotonic()
+        
+        # Websocket callbacks only enqueue; a consumer thread does the work
+        self._tick_q = queue.Queue(maxsize=settings.TICK_QUEUE_SIZE)
+        self._tick_thread = None
+        self._stop_event = threading.Event()
+        self._wake_event = threading.Event()
+        
+        # Ticks are buffered column-wise until the next export or until the
+        # buffers fill up: nanosecond timestamps plus one float64 row per
+        # entry in TICK_COLUMNS
+        self._tick_lock = threading.Lock()
+        self._tick_n = 0
+        self._tick_ts = np.empty(settings.TICK_BUFFER_SIZE, dtype=np.int64)
+        self._tick_data = np.empty((len(TICK_COLUMNS), settings.TICK_BUFFER_SIZE), dtype=np.float64)
         
        
         os.makedirs(settings.DATA_DIR, exist_ok=True)
@@ -52,13 +93,13 @@ class AlgoTradingApp:
             return False
             
        
-        scripmaster_data = fetch_scripmaster_data()
-        if not scripmaster_data:
+        self._scrip_df = self._load_scripmaster()
+        if self._scrip_df is None:
             logger.error("Failed to fetch scripmaster data. Exiting.")
             return False
             
         
-        self.fut_token = self._get_futures_token(scripmaster_data)
+        self.fut_token = self._get_futures_token(self._scrip_df)
         if not self.fut_token:
             logger.warning("Failed to get futures token. Continuing with spot only.")
             
@@ -77,8 +118,11 @@ class AlgoTradingApp:
                
                 self._export_data()
                 
-                
-                time.sleep(300)  
+                # Sleep until the next 5-minute bar closes or its first tick arrives
+                now = datetime.now()
+                next_wake = now.replace(second=0, microsecond=0) + timedelta(minutes=5 - now.minute % 5)
+                self._wake_event.wait((next_wake - now).total_seconds())
+                self._wake_event.clear()
                 
         except KeyboardInterrupt:
             logger.info("Stopping application...")
@@ -89,62 +133,66 @@ class AlgoTradingApp:
             self._shutdown()
             return False
             
-    def _get_futures_token(self, data):
-        """Get NIFTY futures token from scripmaster data."""
-        logger.info("Finding current month NIFTY futures token...")
-        today = datetime.now().date()
-        available_expiries = []
-
-       
-        for item in data:
-            try:
-                if (item.get('exch_seg') == 'NFO' and
-                    item.get('instrumenttype') == 'FUTIDX' and
-                    item.get('name') == 'NIFTY'):
-
-                    expiry_raw = item.get('expiry')
-                    if not expiry_raw:
-                        continue
-
-                    
-                    try:
-                        expiry_date_obj = datetime.strptime(expiry_raw, '%d-%b-%y')
-                    except ValueError:
-                        try:
-                            expiry_date_obj = datetime.strptime(expiry_raw, '%d%b%Y')
-                        except ValueError:
-                            try:
-                                expiry_date_obj = datetime.strptime(expiry_raw, '%d-%m-%Y')
-                            except ValueError:
-                                continue
-
-                    expiry_date = expiry_date_obj.date()
-                    if expiry_date >= today:
-                        available_expiries.append({
-                            'expiry': expiry_date,
-                            'token': item.get('token')
-                        })
+    def _load_scripmaster(self):
+        """
+        Load the NIFTY instruments of the scripmaster. fetch_scripmaster_data
+        keeps the on-disk copy and only downloads it again when it changed.
+        
+        Returns:
+            pd.DataFrame: Scripmaster data or None if it could not be fetched
+        """
+        # Only NIFTY instruments are used, so drop the rest while parsing
+        scripmaster_data = fetch_scripmaster_data(keep=lambda item: item.get('name') == 'NIFTY')
+        if not scripmaster_data:
+            return None
+            
+        return pd.DataFrame(scripmaster_data)
+        
+    def _get_futures_token(self, df):
+        """Get NIFTY futures token from the scripmaster DataFrame."""
+        try:
+            logger.info("Finding current month NIFTY futures token...")
+            today = datetime.now().date()
+            available_expiries = []
 
-            except Exception as e:
-                continue
+            mask = (
+                (df['exch_seg'] == 'NFO') &
+                (df['instrumenttype'] == 'FUTIDX') &
+                (df['name'] == 'NIFTY') &
+                df['expiry'].notna() &
+                (df['expiry'] != '')
+            )
+            futures = df.loc[mask, ['expiry', 'token']]
+        
+            for expiry_raw, token in zip(futures['expiry'], futures['token']):
+                expiry_date_obj = parse_expiry_date(expiry_raw)
+                if expiry_date_obj is None:
+                    continue
+                
+                expiry_date = expiry_date_obj.date()
+                if expiry_date >= today:
+                    available_expiries.append((expiry_date, token))
 
-        if not available_expiries:
-            logger.error("No valid NIFTY futures expiries found")
-            return None
+            if not available_expiries:
+                logger.error("No valid NIFTY futures expiries found")
+                return None
 
         
-        available_expiries.sort(key=lambda x: x['expiry'])
+            available_expiries.sort()
 
         
-        if available_expiries[0]['expiry'] == today and len(available_expiries) > 1:
-            selected_expiry = available_expiries[1]
-            logger.info(f"Today is expiry day, using next available expiry: {selected_expiry['expiry']}")
-        else:
-            selected_expiry = available_expiries[0]
-            logger.info(f"Using nearest expiry: {selected_expiry['expiry']}")
+            if available_expiries[0][0] == today and len(available_expiries) > 1:
+                selected_expiry, selected_token = available_expiries[1]
+                logger.info(f"Today is expiry day, using next available expiry: {selected_expiry}")
+            else:
+                selected_expiry, selected_token = available_expiries[0]
+                logger.info(f"Using nearest expiry: {selected_expiry}")
 
-        logger.info(f"Found NIFTY futures token {selected_expiry['token']} for expiry {selected_expiry['expiry']}")
-        return selected_expiry['token']
+            logger.info(f"Found NIFTY futures token {selected_token} for expiry {selected_expiry}")
+            return selected_token
+        except Exception as e:
+            logger.error(f"Error finding NIFTY futures token: {e}")
+            return None
             
     def _initialize_historical_data(self):
         """Initialize data with historical OHLCV."""
@@ -167,13 +215,14 @@ class AlgoTradingApp:
             
            
             self.spot_1min.initialize_from_historical(spot_historical)
-            self.spot_5min.initialize_from_historical(spot_historical.copy())
-            self.spot_15min.initialize_from_historical(spot_historical.copy())
+            self.spot_5min.initialize_from_historical(resample_ohlcv(spot_historical, '5min'), already_aggregated=True)
+            self.spot_15min.initialize_from_historical(resample_ohlcv(spot_historical, '15min'), already_aggregated=True)
             
            
             spot_df = self.spot_5min.get_dataframe()
             self.spot_strategy = BullishSwingStrategy(spot_df, self.broker)
             self.spot_strategy.generate_signals()
+            self._last_signal_ts = spot_df.index[-1]
             
             logger.info("Initialized strategies with historical data")
         else:
@@ -199,8 +248,10 @@ class AlgoTradingApp:
         
         
         def on_tick_data(message):
-            self._process_tick(message)
+            self._enqueue_tick(message)
         
+        self._tick_thread = threading.Thread(target=self._tick_consumer, name="tick-consumer", daemon=True)
+        self._tick_thread.start()
         
         self.websocket = self.broker.start_websocket(token_list, on_tick_data)
         
@@ -211,55 +262,157 @@ class AlgoTradingApp:
             logger.error("Failed to establish websocket connection")
             return False
     
-    def _process_tick(self, tick_data):
-        """Process incoming tick data."""
+    def _enqueue_tick(self, message):
+        """
+        Queue a websocket message with its receive time, dropping the oldest
+        one if the queue is full. The time is taken here rather than in the
+        consumer so a backed-up queue cannot move ticks into a later candle.
+        """
+        message = (datetime.now(), message)
         try:
-           
-            if isinstance(tick_data, str):
-                import json
-                tick_data = json.loads(tick_data)
+            self._tick_q.put_nowait(message)
+        except queue.Full:
+            try:
+                self._tick_q.get_nowait()
+            except queue.Empty:
+                pass
+            try:
+                self._tick_q.put_nowait(message)
+            except queue.Full:
+                logger.warning("Tick queue full, dropping tick")
+    
+    def _tick_consumer(self):
+        """
+        Drain queued websocket messages in batches and process them.
+        After the first message of a batch arrives, messages arriving within
+        TICK_COALESCE_MS are processed together with it. Messages still
+        queued when the stop event is set are processed before returning.
+        """
+        batch_size = settings.TICK_BATCH_SIZE
+        coalesce_sec = settings.TICK_COALESCE_MS / 1000
+        while not self._stop_event.is_set():
+            try:
+                batch = [self._tick_q.get(timeout=1)]
+            except queue.Empty:
+                continue
                 
-            if isinstance(tick_data, dict) and 'data' in tick_data:
-                for item in tick_data['data']:
-                    token = str(item.get('token', ''))
-                    
-                   
-                    if token == self.spot_token:
-                        price = float(item.get('last_traded_price', 0)) * 0.01 
-                        
-                        
-                        current_time = datetime.now()
-                        structured_tick = {
-                            'timestamp': current_time,
-                            'ltp': price,
-                            'token': token
-                        }
-                        
-                       
-                        for field in ['last_traded_quantity', 'volume', 'open', 'high', 'low', 'close']:
-                            if field in item and item[field] is not None:
-                               
-                                if field in ['open', 'high', 'low', 'close']:
-                                    structured_tick[field] = float(item[field]) * 0.01
-                                else:
-                                    structured_tick[field] = item[field]
-                        
-                       
-                        self.spot_ticks.append(structured_tick)
-                        self.spot_ltp = price
-                        self.tick_count += 1
+            deadline = time.monotonic() + coalesce_sec
+            while len(batch) < batch_size:
+                try:
+                    batch.append(self._tick_q.get_nowait())
+                except queue.Empty:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    try:
+                        batch.append(self._tick_q.get(timeout=remaining))
+                    except queue.Empty:
+                        break
                         
-                      
-                        self.spot_1min.update_from_tick(structured_tick)
-                        self.spot_5min.update_from_tick(structured_tick)
-                        self.spot_15min.update_from_tick(structured_tick)
+            self._process_ticks(batch)
+            
+        # Process whatever is still queued so those ticks are exported too
+        batch = []
+        while True:
+            try:
+                batch.append(self._tick_q.get_nowait())
+            except queue.Empty:
+                break
+        if batch:
+            self._process_ticks(batch)
+    
+    def _process_ticks(self, messages):
+        """
+        Process a batch of incoming tick messages.
+        
+        Args:
+            messages (list): (receive time, websocket message) pairs
+        """
+        times = []
+        items = []
+        for received_at, tick_data in messages:
+            try:
+               
+                # The broker already decodes JSON frames; only raw text needs parsing
+                if isinstance(tick_data, (str, bytes)):
+                    tick_data = orjson.loads(tick_data)
+                    
+                if isinstance(tick_data, dict) and 'data' in tick_data:
+                    for item in tick_data['data']:
+                        token = item.get('token')
                         
                        
-                        self._check_breakout_signals('spot', price)
+                        if token is not None and int(token) == self._spot_token_i:
+                            times.append(received_at)
+                            items.append(item)
+                            
+            except Exception as e:
+                logger.error(f"Error processing tick: {e}")
+                
+        if not items:
+            return
+            
+        try:
+            rows = [
+                (item.get('last_traded_price', 0), item.get('last_traded_quantity'), item.get('volume'),
+                 item.get('open'), item.get('high'), item.get('low'), item.get('close'))
+                for item in items
+            ]
+            times, columns = self._tick_columns(times, rows)
+            if not times:
+                return
+            columns[_PRICE_ROWS] *= 0.01
+            
+            ts_ns = np.array([(t - _EPOCH) // _ONE_US for t in times], dtype=np.int64) * 1000
+            self._buffer_ticks(ts_ns, columns)
+            
+            views = self._views
+            for tick_ns, price in zip(ts_ns.tolist(), columns[0].tolist()):
+                new_1min, new_5min, new_15min = update_from_tick_multi(views, tick_ns, price)
+                if new_5min:
+                    self._wake_event.set()
+                
+               
+                self._check_breakout_signals('spot', price)
+                
+            self.spot_ltp = price
+            self.tick_count += len(times)
                         
         except Exception as e:
             logger.error(f"Error processing tick: {e}")
     
+    def _tick_columns(self, times, rows):
+        """
+        Convert tick rows to one float64 row per TICK_COLUMNS entry; missing
+        fields become NaN. A malformed field fails the bulk conversion, so
+        the rows are then converted one by one and only the bad ticks are
+        skipped.
+        
+        Args:
+            times (list): Receive time of each tick
+            rows (list): Tick field tuples in TICK_COLUMNS order
+            
+        Returns:
+            tuple: (times of the converted ticks, np.ndarray of tick values)
+        """
+        try:
+            return times, np.array(rows, dtype=np.float64).T
+        except (TypeError, ValueError):
+            pass
+            
+        good_times = []
+        good_rows = []
+        for received_at, row in zip(times, rows):
+            try:
+                good_rows.append(np.array(row, dtype=np.float64))
+                good_times.append(received_at)
+            except (TypeError, ValueError) as e:
+                logger.warning(f"Skipping malformed tick {row}: {e}")
+                
+        if not good_rows:
+            return [], np.empty((len(TICK_COLUMNS), 0))
+        return good_times, np.array(good_rows).T
+    
     def _check_breakout_signals(self, instrument, price):
         """Check for breakout signals in live ticks."""
         try:
@@ -288,44 +441,13 @@ class AlgoTradingApp:
             spot_df = self.spot_5min.get_dataframe()
             
             if not spot_df.empty and self.spot_strategy:
-              
-                current_structure = {
-                    'H1': self.spot_strategy.H1,
-                    'H1_idx': self.spot_strategy.H1_idx,
-                    'L1': self.spot_strategy.L1,
-                    'L1_idx': self.spot_strategy.L1_idx,
-                    'A': self.spot_strategy.A,
-                    'A_idx': self.spot_strategy.A_idx,
-                    'B': self.spot_strategy.B,
-                    'B_idx': self.spot_strategy.B_idx,
-                    'C': self.spot_strategy.C,
-                    'C_idx': self.spot_strategy.C_idx,
-                    'D': self.spot_strategy.D,
-                    'D_idx': self.spot_strategy.D_idx,
-                    'pending_setup': self.spot_strategy.pending_setup
-                }
-                
-               
-                self.spot_strategy = BullishSwingStrategy(spot_df, self.broker)
-                
-               
-                if current_structure['pending_setup']:
-                    self.spot_strategy.H1 = current_structure['H1']
-                    self.spot_strategy.H1_idx = current_structure['H1_idx']
-                    self.spot_strategy.L1 = current_structure['L1']
-                    self.spot_strategy.L1_idx = current_structure['L1_idx']
-                    self.spot_strategy.A = current_structure['A']
-                    self.spot_strategy.A_idx = current_structure['A_idx']
-                    self.spot_strategy.B = current_structure['B']
-                    self.spot_strategy.B_idx = current_structure['B_idx']
-                    self.spot_strategy.C = current_structure['C']
-                    self.spot_strategy.C_idx = current_structure['C_idx']
-                    self.spot_strategy.D = current_structure['D']
-                    self.spot_strategy.D_idx = current_structure['D_idx']
-                    self.spot_strategy.pending_setup = current_structure['pending_setup']
-                
-             
-                self.spot_strategy.generate_signals()
+                last_ts = spot_df.index[-1]
+                if last_ts == self._last_signal_ts:
+                    logger.debug(f"No new 5min bar since {last_ts}, skipping strategy update")
+                    return
+                    
+                self.spot_strategy.update(spot_df)
+                self._last_signal_ts = last_ts
                 logger.info("Updated strategies with latest data")
                 
               
@@ -335,22 +457,19 @@ class AlgoTradingApp:
             logger.error(f"Error updating strategies: {e}")
     
     def _export_data(self):
-        """Export data to CSV files."""
+        """Export candle and tick data to files."""
         try:
             
-            current_time = datetime.now()
-            if not hasattr(self, 'last_export_time'):
-                self.last_export_time = current_time
-                
-            if (current_time - self.last_export_time).total_seconds() < 1800:  # 30 minutes
+            current_time = time.monotonic()
+            if current_time - self.last_export_time < 1800:  # 30 minutes
                 return
                 
-            logger.info("Exporting data to CSV files")
+            logger.info("Exporting data files")
             
            
-            self.spot_1min.export_to_csv()
-            self.spot_5min.export_to_csv()
-            self.spot_15min.export_to_csv()
+            self.spot_1min.export()
+            self.spot_5min.export()
+            self.spot_15min.export()
             
             
             self._export_ticks()
@@ -360,25 +479,57 @@ class AlgoTradingApp:
         except Exception as e:
             logger.error(f"Error exporting data: {e}")
     
+    def _buffer_ticks(self, ts_ns, columns):
+        """
+        Append spot ticks to the raw tick column buffers.
+        
+        Args:
+            ts_ns (np.ndarray): Tick times as wall-clock nanoseconds since the epoch
+            columns (np.ndarray): Tick values, one row per entry in TICK_COLUMNS
+        """
+        count = len(ts_ns)
+        
+        # Flush to disk rather than grow, so the buffers keep a fixed size
+        if self._tick_n + count > self._tick_ts.shape[0]:
+            self._export_ticks()
+            
+        with self._tick_lock:
+            start = self._tick_n
+            end = start + count
+            self._tick_ts[start:end] = ts_ns
+            self._tick_data[:, start:end] = columns
+            self._tick_n = end
+    
     def _export_ticks(self):
-        """Export raw tick data to CSV."""
+        """Export buffered raw ticks to a Parquet file, or CSV without pyarrow."""
         try:
-            if not self.spot_ticks:
+            with self._tick_lock:
+                count = self._tick_n
+                ts_ns = self._tick_ts[:count].copy()
+                columns = self._tick_data[:, :count].copy()
+                self._tick_n = 0
+                
+            if not count:
                 return
                 
-            
             timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-            filename = os.path.join(settings.RAW_TICKS_DIR, f"spot_ticks_{timestamp}.csv")
-            
-         
-            df = pd.DataFrame(self.spot_ticks)
-            df.to_csv(filename, index=False)
             
-            logger.info(f"Exported {len(self.spot_ticks)} spot ticks to {filename}")
-            
-           
-            if len(self.spot_ticks) > 10000:
-                self.spot_ticks = self.spot_ticks[-5000:]
+            if pq is not None:
+                filename = os.path.join(settings.RAW_TICKS_DIR, f"spot_ticks_{timestamp}.parquet")
+                table = pa.Table.from_arrays(
+                    [pa.array(ts_ns.view('datetime64[ns]'))] +
+                    [pa.array(col) for col in columns],
+                    schema=_TICK_SCHEMA
+                )
+                pq.write_table(table, filename, compression='zstd')
+            else:
+                filename = os.path.join(settings.RAW_TICKS_DIR, f"spot_ticks_{timestamp}.csv")
+                with open(filename, 'w', newline='') as f:
+                    writer = csv.writer(f)
+                    writer.writerow(('timestamp',) + TICK_COLUMNS)
+                    writer.writerows(zip(ts_ns.view('datetime64[ns]').astype(str), *columns))
+                    
+            logger.info(f"Exported {count} spot ticks to {filename}")
                 
         except Exception as e:
             logger.error(f"Error exporting ticks: {e}")
@@ -388,11 +539,21 @@ class AlgoTradingApp:
         logger.info("Shutting down application...")
         
         
+        self._stop_event.set()
+        if self._tick_thread:
+            self._tick_thread.join(timeout=5)
+            
         try:
             self._export_data()
         except Exception as e:
             logger.error(f"Error exporting data during shutdown: {e}")
             
+        for candles in (self.spot_1min, self.spot_5min, self.spot_15min):
+            candles.close()
+        self._export_ticks()
+        if self.spot_strategy:
+            self.spot_strategy.close_order_file()
+            
        
         if self.websocket:
             logger.info("Closing websocket connection")
@@ -4,10 +4,14 @@ Provides classes and functions for working with option data.
 """
 import pandas as pd
 import numpy as np
-from datetime import datetime
+from dataclasses import dataclass, asdict
+from datetime import datetime, date
 from ..utils.logger import logger
 from ..config import settings
 
+# Theta scaling for the stop loss window: (abs(theta) / (24 * 6)) * (10/60)
+_THETA_PER_BAR = 10.0 / (60.0 * 24.0 * 6.0)
+
 class OptionData:
     """Class representing option data with Greeks and calculations."""
     
@@ -81,14 +85,16 @@ class OptionData:
             dict: Stop loss calculation details
         """
         try:
-            underlying_move = abs(underlying_entry - underlying_sl)
+            underlying_move = underlying_entry - underlying_sl
+            if underlying_move < 0:
+                underlying_move = -underlying_move
             
             delta_impact = self.delta * underlying_move  
-            gamma_impact = 0.5 * self.gamma * (underlying_move ** 2)  
+            gamma_impact = 0.5 * self.gamma * (underlying_move * underlying_move)  
             
             
           
-            theta_impact = (abs(self.theta) / (24 * 6)) * (10/60)             
+            theta_impact = abs(self.theta) * _THETA_PER_BAR             
            
             total_sl = delta_impact + gamma_impact + theta_impact
             
@@ -115,6 +121,33 @@ class OptionData:
             logger.error(f"Error calculating option stop loss: {e}")
             return None
             
+    @staticmethod
+    def calculate_stop_loss_batch(options_data, underlying_entry, underlying_sl):
+        """
+        Calculate the stop loss price change for every option in a DataFrame.
+        Uses the same Greeks model as calculate_stop_loss without creating
+        an OptionData per row.
+        
+        Args:
+            options_data (pd.DataFrame): Options data with delta, gamma and theta columns
+            underlying_entry (float): Entry price of the underlying
+            underlying_sl (float): Stop loss price of the underlying
+            
+        Returns:
+            pd.Series: Risk per lot for each option, indexed like options_data,
+                NaN where a Greek is missing
+        """
+        underlying_move = abs(underlying_entry - underlying_sl)
+        delta = OptionData._numeric_column(options_data, 'delta')
+        gamma = OptionData._numeric_column(options_data, 'gamma')
+        theta = OptionData._numeric_column(options_data, 'theta')
+        
+        delta_impact = delta * underlying_move
+        gamma_impact = 0.5 * gamma * (underlying_move * underlying_move)
+        theta_impact = np.abs(theta) * _THETA_PER_BAR
+        
+        return pd.Series(delta_impact + gamma_impact + theta_impact, index=options_data.index, name='risk_per_lot')
+        
     @staticmethod
     def select_optimal_strike(options_data, current_price, target_risk_range=(800, 900), lot_size=75):
         """
@@ -136,43 +169,88 @@ class OptionData:
         target_min, target_max = target_risk_range
         target_mid = (target_min + target_max) / 2
         
-       
-        options = []
-        for _, row in options_data.iterrows():
-            option = OptionData(row.to_dict())
-            options.append(option)
-            
+        risk_per_lot = OptionData.calculate_stop_loss_batch(
+            options_data, current_price, current_price * 0.995
+        ).to_numpy()
         
-        valid_options = []
-        for option in options:
-            if option.calculate_stop_loss(current_price, current_price * 0.995): 
-                valid_options.append(option)
-                
-        if not valid_options:
+        # Options with missing Greeks have no usable risk
+        valid = np.isfinite(risk_per_lot)
+        if not valid.any():
             logger.warning("No valid options with stop loss calculation")
             return None, None, None
             
-       
-        options_in_range = []
-        for option in valid_options:
-          
-            for lots in range(1, 51): 
-                quantity = lots * lot_size
-                total_risk = option.risk_per_lot * quantity
-                
-                if target_min <= total_risk <= target_max:
-                    options_in_range.append((option, quantity, total_risk, abs(total_risk - target_mid)))
-                    
-               
-                if total_risk > target_max:
-                    break
-                    
-        if options_in_range:
-           
-            options_in_range.sort(key=lambda x: x[3])  
-            return options_in_range[0][:3] 
+        # Total risk for 1 to 50 lots of every option, one row per option
+        quantities = np.arange(1, 51) * lot_size
+        total_risk = risk_per_lot[:, None] * quantities
+        in_range = valid[:, None] & (total_risk >= target_min) & (total_risk <= target_max)
+        
+        if in_range.any():
+            distance = np.where(in_range, np.abs(total_risk - target_mid), np.inf)
+            row, col = np.unravel_index(np.argmin(distance), distance.shape)
+            quantity = int(quantities[col])
         else:
+            row = np.nanargmin(np.where(valid, np.abs(risk_per_lot * lot_size - target_mid), np.nan))
+            quantity = lot_size
             
-            valid_options.sort(key=lambda opt: abs(opt.risk_per_lot * lot_size - target_mid))
-            closest_option = valid_options[0]
-            return closest_option, lot_size, closest_option.risk_per_lot * lot_size
+        # Only the selected row is turned into an OptionData
+        option = OptionData(options_data.iloc[int(row)].to_dict())
+        option.calculate_stop_loss(current_price, current_price * 0.995)
+        return option, quantity, option.risk_per_lot * quantity
+        
+    @staticmethod
+    def _numeric_column(df, column):
+        """
+        Get a DataFrame column as float64. Missing and non-numeric values
+        become NaN rather than 0, unlike in OptionData, so that
+        select_optimal_strike can skip options without Greeks.
+        
+        Args:
+            df (pd.DataFrame): Options data
+            column (str): Column name
+            
+        Returns:
+            np.ndarray: Column values, zeros if the column is absent
+        """
+        if column not in df.columns:
+            return np.zeros(len(df))
+        return pd.to_numeric(df[column], errors='coerce').to_numpy(dtype=np.float64)
+
+
+@dataclass(slots=True)
+class OptionContract:
+    """NIFTY option instrument from the ScripMaster, as returned by extract_nifty_options_data."""
+    token: str | None = None
+    symbol: str | None = None
+    name: str | None = None
+    expiry: str | None = None
+    strike: str | None = None
+    lotsize: str | None = None
+    instrumenttype: str | None = None
+    exch_seg: str | None = None
+    tick_size: str | None = None
+    option_type: str | None = None
+    expiry_date: date | None = None
+    expiry_formatted: str | None = None
+    expiry_smartapi: str | None = None
+    strike_float: float | None = None
+    original_strike: float | None = None
+    match_key: str | None = None
+    
+    def get(self, key, default=None):
+        """
+        Dict-style field access, so the contract can be passed where an
+        option dictionary is expected (e.g. OptionData).
+        
+        Args:
+            key (str): Field name
+            default: Value returned for unknown or unset fields
+            
+        Returns:
+            Field value or default
+        """
+        value = getattr(self, key, None)
+        return default if value is None else value
+        
+    def to_dict(self):
+        """Convert to dictionary representation."""
+        return asdict(self)
@@ -0,0 +1,16 @@
+"""
+Trade setup model module.
+Provides the setup a strategy holds while waiting for a breakout.
+"""
+from dataclasses import dataclass
+
+
+@dataclass(slots=True)
+class PendingSetup:
+    """Entry, stop loss and target of a structure waiting for its breakout."""
+    entry_price: float
+    stop_loss: float
+    target: float
+    structure: tuple
+    options_data: object = None
+    strategy_type: str = 'CE_BUYING'
@@ -5,13 +5,152 @@ Implements a trading strategy based on bullish swing patterns.
 import pandas as pd
 import numpy as np
 import os
+import csv
+import logging
 import time
 from datetime import datetime
 
 from ..utils.logger import logger
+from ..utils.jit import njit
 from ..models.option import OptionData
+from ..models.setup import PendingSetup
 from ..config import settings
 
+# Structure points in the order used by the state arrays of _scan_bullish
+_POINTS = ('L1', 'H1', 'A', 'B', 'C', 'D')
+_L1, _H1, _A, _B, _C, _D = range(6)
+_STRUCTURE_ORDER = (('H1', _H1), ('L1', _L1), ('A', _A), ('B', _B), ('C', _C), ('D', _D))
+# Price column each structure point is taken from
+_POINT_COLUMNS = ('low', 'high', 'low', 'low', 'low', 'high')
+
+@njit(cache=True)
+def _clear_points(points, idx, setup, first):
+    """Reset structure points from `first` onwards and drop the pending setup."""
+    for p in range(first, 6):
+        points[p] = np.nan
+        idx[p] = -1
+    setup[:] = np.nan
+
+# Explicit signature for the arrays built by detect_swings and _run_scan, so
+# the kernel is compiled (or loaded from the cache) at import rather than on
+# the first scan
+_SCAN_SIGNATURE = (
+    "Tuple((int64[::1], float64[:, ::1], float64[:, ::1], int64[:, ::1], boolean))("
+    "float32[::1], float32[::1], boolean[::1], boolean[::1], boolean[::1], "
+    "int64, int64, float32[::1], int64[::1], float64[::1])"
+)
+
+@njit(_SCAN_SIGNATURE, cache=True)
+def _scan_bullish(highs, lows, swing_hi, swing_lo, low_lt_prev, start, stop, points, idx, setup):
+    """
+    Run the bullish structure state machine over bars from `start` to `stop`.
+    The state arrays are updated in place.
+    
+    Args:
+        highs, lows (np.ndarray): Candle highs and lows
+        swing_hi, swing_lo (np.ndarray): Swing high and swing low masks
+        low_lt_prev (np.ndarray): Mask of candles whose low is below the previous low
+        start (int): Index of the first bar to process
+        stop (int): Index after the last bar to process
+        points (np.ndarray): Prices of L1, H1, A, B, C, D (NaN if not formed)
+        idx (np.ndarray): Indices of L1, H1, A, B, C, D (-1 if not formed)
+        setup (np.ndarray): Pending entry, stop loss and target (NaN if none)
+        
+    Returns:
+        tuple: (event indices, event entry/stop loss/target, event point prices,
+            event point indices, whether the pending setup was created in this scan)
+    """
+    n = max(stop - start, 0)
+    ev_idx = np.empty(n, dtype=np.int64)
+    ev_px = np.empty((n, 3), dtype=np.float64)
+    ev_points = np.empty((n, 6), dtype=np.float64)
+    ev_point_idx = np.empty((n, 6), dtype=np.int64)
+    k = 0
+    d_calculated = False
+    
+    i = start
+    while i < stop:
+        # While a setup is pending A, B and C are fixed, so only a breakout or
+        # a new L1/H1 extreme can change the state; sweep straight to that bar
+        if not np.isnan(setup[0]):
+            d = points[_D]
+            l1 = points[_L1]
+            h1 = points[_H1]
+            while i < stop and highs[i] <= d and not (swing_lo[i] and lows[i] < l1) and not (swing_hi[i] and highs[i] > h1):
+                i += 1
+            if i == stop:
+                break
+                
+        high = highs[i]
+        low = lows[i]
+        
+        # L1 detection and updates
+        if swing_lo[i] and low < points[_L1]:
+            points[_L1] = low
+            idx[_L1] = i
+            _clear_points(points, idx, setup, _H1)
+            d_calculated = False
+            
+        # H1 detection and updates
+        if idx[_L1] >= 0 and swing_hi[i]:
+            if i > idx[_L1] and high > points[_L1]:
+                if idx[_H1] < 0:
+                    points[_H1] = high
+                    idx[_H1] = i
+                elif high > points[_H1]:
+                    points[_H1] = high
+                    idx[_H1] = i
+                    _clear_points(points, idx, setup, _A)
+                    d_calculated = False
+                    
+        # A point detection
+        if idx[_H1] >= 0 and idx[_L1] >= 0:
+            if idx[_A] < 0 and swing_lo[i]:
+                if i > idx[_H1] and low > points[_L1]:
+                    points[_A] = low
+                    idx[_A] = i
+                    
+        # B point detection
+        if idx[_A] >= 0:
+            if idx[_B] < 0 and swing_lo[i]:
+                if i > idx[_A] + 1 and low > points[_A]:
+                    points[_B] = low
+                    idx[_B] = i
+                    
+        # C and D point detection; D is the highest high from B to C
+        if idx[_B] >= 0:
+            if idx[_C] < 0:
+                if i > idx[_B] and low_lt_prev[i] and low > points[_B]:
+                    points[_C] = low
+                    idx[_C] = i
+                    if idx[_H1] >= 0:
+                        best = idx[_B] + np.argmax(highs[idx[_B]:i + 1])
+                        points[_D] = highs[best]
+                        idx[_D] = best
+                        setup[0] = points[_D] + 0.05
+                        setup[1] = points[_C] - 0.05
+                        setup[2] = setup[0] + (setup[0] - setup[1]) * 2
+                        d_calculated = True
+                        
+        # Breakout detection
+        if not np.isnan(setup[0]):
+            if high > points[_D]:
+                ev_idx[k] = i
+                ev_px[k, :] = setup
+                ev_points[k, :] = points
+                ev_point_idx[k, :] = idx
+                k += 1
+                
+                # Start looking for a new structure from this candle's low
+                _clear_points(points, idx, setup, _L1)
+                points[_L1] = low
+                idx[_L1] = i
+                d_calculated = False
+                
+        i += 1
+        
+    return ev_idx[:k], ev_px[:k], ev_points[:k], ev_point_idx[:k], d_calculated
+
 class BullishSwingStrategy:
     """
     Strategy that identifies and trades bullish swing patterns.
@@ -19,6 +158,16 @@ class BullishSwingStrategy:
     and generates trading signals when price breaks above the D point.
     """
     
+    # Attributes cleared by reset_points for each structure point
+    _RESET_MAP = {
+        'H1': ('H1', 'H1_idx'),
+        'L1': ('L1', 'L1_idx'),
+        'A': ('A', 'A_idx'),
+        'B': ('B', 'B_idx'),
+        'C': ('C', 'C_idx'),
+        'D': ('D', 'D_idx', 'pending_setup')
+    }
+    
     def __init__(self, data, broker=None):
         """
         Initialize the strategy with price data and broker connection.
@@ -27,16 +176,21 @@ class BullishSwingStrategy:
             data (pd.DataFrame): Price data with OHLCV columns
             broker: Broker instance for placing orders
         """
-        # Store the data and broker connection
-        self.data = data.copy() if not data.empty else pd.DataFrame()
+        # Store the data and broker connection. The strategy never modifies
+        # the frame in place, so it is kept by reference rather than copied
+        self.data = data if not data.empty else pd.DataFrame()
         self.broker = broker
         
-        # Initialize signal tracking
-        self.signals = pd.DataFrame(index=self.data.index) if not self.data.empty else pd.DataFrame()
-        self.signals['signal'] = 0
-        self.signals['entry_price'] = np.nan
-        self.signals['stop_loss'] = np.nan
-        self.signals['target'] = np.nan
+        # Initialize signal tracking; breakouts are collected as
+        # (index, entry_price, stop_loss, target) and written in bulk
+        self._signal_events = []
+        self.signals = self._build_signals()
+        
+        # Column positions of the signals frame, which always has the same layout
+        self._col_signal = self.signals.columns.get_loc('signal')
+        self._col_entry_price = self.signals.columns.get_loc('entry_price')
+        self._col_stop_loss = self.signals.columns.get_loc('stop_loss')
+        self._col_target = self.signals.columns.get_loc('target')
         
         # Initialize structure points
         self.H1 = None
@@ -64,8 +218,22 @@ class BullishSwingStrategy:
         self.order_counter = 0
         self.signal_counter = 0
         
+        # Order history file, opened on the first order of each day
+        self._order_csv_fh = None
+        self._order_writer = None
+        self._order_csv_date = None
+        
+        # Incremental processing state
+        self._resume_ts = None
+        self._next_idx = 0
+        self._checkpoint = None
+        
+        # Swing masks, refreshed by detect_swings whenever the data changes
+        self.detect_swings()
+        
         # Greeks data caching
         self.last_greeks_refresh = None
+        self._greeks_refresh_mono = None
         self.greeks_refresh_interval = settings.GREEKS_REFRESH_INTERVAL
         self.cached_options_data = None
         
@@ -83,12 +251,15 @@ class BullishSwingStrategy:
         Returns:
             bool: True if entry conditions are met, False otherwise
         """
-        if self.signals.iloc[idx]['signal'] == 1:
+        if self.signals.iat[idx, self._col_signal] == 1:
             return True
         return False
     
     def print_current_structure(self):
         """Print the current bullish structure information."""
+        if not logger.isEnabledFor(logging.INFO):
+            return
+            
         logger.info("\n===== CURRENT BULLISH STRUCTURE =====")
         
         def format_point(name, value, idx):
@@ -113,12 +284,12 @@ class BullishSwingStrategy:
         
         if self.pending_setup:
             logger.info("\n----- PENDING SETUP -----")
-            logger.info(f"Entry Price: {self.pending_setup['entry_price']:.2f}")
-            logger.info(f"Stop Loss: {self.pending_setup['stop_loss']:.2f}")
-            logger.info(f"Target: {self.pending_setup['target']:.2f}")
+            logger.info(f"Entry Price: {self.pending_setup.entry_price:.2f}")
+            logger.info(f"Stop Loss: {self.pending_setup.stop_loss:.2f}")
+            logger.info(f"Target: {self.pending_setup.target:.2f}")
             
-            risk = self.pending_setup['entry_price'] - self.pending_setup['stop_loss']
-            reward = self.pending_setup['target'] - self.pending_setup['entry_price']
+            risk = self.pending_setup.entry_price - self.pending_setup.stop_loss
+            reward = self.pending_setup.target - self.pending_setup.entry_price
             risk_reward = reward / risk if risk > 0 else 0
             logger.info(f"Risk:Reward - 1:{risk_reward:.2f}")
             
@@ -132,52 +303,45 @@ class BullishSwingStrategy:
         if self.H1 is not None and self.B is not None and self.C is not None:
             logger.info(f"Calculating D point with B={self.B:.2f} (swing low), C={self.C:.2f}")
             
-            # Initialize D with B's price (B is a swing low, and D should be a high after B)
-            highest_high = self.data.iloc[self.B_idx]['high']
-            highest_high_idx = self.B_idx
+            # Highest high from B to C (inclusive); argmax keeps the first one on ties
+            highest_high_idx = self.B_idx + int(self._highs[self.B_idx:self.C_idx + 1].argmax())
             
-            # Scan from B to C (inclusive) to find the highest high
-            for i in range(self.B_idx + 1, self.C_idx + 1):
-                current_high = self.data.iloc[i]['high']
-                if current_high > highest_high:
-                    highest_high = current_high
-                    highest_high_idx = i
-                    
-            self.D = highest_high
+            self.D = float(self._price('high', highest_high_idx))
             self.D_idx = highest_high_idx
-            d_time = self.data.index[self.D_idx]
-            
-            logger.info(f"POINT CALCULATION: D calculated at price {self.D:.2f} at time {d_time}")
-            
-            # Calculate trade parameters
-            entry_price = self.D + 0.05  # Small buffer above D
-            stop_loss = self.C - 0.05  # Below C point for stop loss
-            risk = entry_price - stop_loss
-            target = entry_price + (risk * 2)  # 1:2 Risk-Reward
-            
-            self.pending_setup = {
-                'entry_price': entry_price,
-                'stop_loss': stop_loss,
-                'target': target,
-                'structure': {
-                    'H1': (self.H1_idx, self.H1),
-                    'L1': (self.L1_idx, self.L1),
-                    'A': (self.A_idx, self.A),
-                    'B': (self.B_idx, self.B),
-                    'C': (self.C_idx, self.C),
-                    'D': (self.D_idx, self.D)
-                },
-                'options_data': None,
-                'strategy_type': 'CE_BUYING'
-            }
             
-            # Fetch options data if broker is available
-            if self.broker and hasattr(self.broker, 'api'):
-                self.refresh_option_greeks(force_refresh=True)
+            if logger.isEnabledFor(logging.INFO):
+                logger.info(f"POINT CALCULATION: D calculated at price {self.D:.2f} at time {self.data.index[self.D_idx]}")
+            
+            self._set_pending_setup()
+    
+    def _set_pending_setup(self):
+        """Create the pending setup from the current C and D points and fetch option Greeks."""
+        # Calculate trade parameters
+        entry_price = self.D + 0.05  # Small buffer above D
+        stop_loss = self.C - 0.05  # Below C point for stop loss
+        risk = entry_price - stop_loss
+        target = entry_price + (risk * 2)  # 1:2 Risk-Reward
+        
+        self.pending_setup = PendingSetup(
+            entry_price=entry_price,
+            stop_loss=stop_loss,
+            target=target,
+            structure=self._pack_structure()
+        )
+        
+        # Fetch options data if broker is available
+        if self.broker and hasattr(self.broker, 'api'):
+            self.refresh_option_greeks(force_refresh=True)
+    
+    def _pack_structure(self):
+        """Pack the current points as (H1_idx, H1, L1_idx, L1, ..., D_idx, D)."""
+        return (self.H1_idx, self.H1, self.L1_idx, self.L1, self.A_idx, self.A,
+                self.B_idx, self.B, self.C_idx, self.C, self.D_idx, self.D)
     
     def is_swing_high(self, idx):
         """
         Check if the given index represents a swing high.
+        Uses the masks computed by detect_swings.
         
         Args:
             idx (int): Index in the data to check
@@ -185,18 +349,14 @@ class BullishSwingStrategy:
         Returns:
             bool: True if it's a swing high, False otherwise
         """
-        if idx <= 0 or idx >= len(self.data) - 1:
+        if idx <= 0 or idx >= len(self._swing_hi) - 1:
             return False
-            
-        current_high = self.data.iloc[idx]['high']
-        prev_high = self.data.iloc[idx-1]['high']
-        next_high = self.data.iloc[idx+1]['high']
-        
-        return current_high > prev_high and current_high > next_high
+        return bool(self._swing_hi[idx])
     
     def is_swing_low(self, idx):
         """
         Check if the given index represents a swing low.
+        Uses the masks computed by detect_swings.
         
         Args:
             idx (int): Index in the data to check
@@ -204,31 +364,61 @@ class BullishSwingStrategy:
         Returns:
             bool: True if it's a swing low, False otherwise
         """
-        if idx <= 0 or idx >= len(self.data) - 1:
+        if idx <= 0 or idx >= len(self._swing_lo) - 1:
             return False
-            
-        current_low = self.data.iloc[idx]['low']
-        prev_low = self.data.iloc[idx-1]['low']
-        next_low = self.data.iloc[idx+1]['low']
-        
-        return current_low < prev_low and current_low < next_low
+        return bool(self._swing_lo[idx])
     
     def detect_swings(self):
-        """Detect swing highs and lows in the data."""
+        """
+        Detect swing highs and lows in the data and cache the high and low
+        columns as arrays. A candle is a swing high (low) when its high (low) is strictly above
+        (below) both neighbours; the first and last candles never are.
+        """
+        n = len(self.data)
+        self._swing_hi = np.zeros(n, dtype=bool)
+        self._swing_lo = np.zeros(n, dtype=bool)
+        self._low_lt_prev = np.zeros(n, dtype=bool)
         self.swing_highs = []
         self.swing_lows = []
         
-        for i in range(1, len(self.data) - 1):
-            if self.is_swing_high(i):
-                self.swing_highs.append((i, self.data.iloc[i]['high']))
-                
-            if self.is_swing_low(i):
-                self.swing_lows.append((i, self.data.iloc[i]['low']))
+        # Column arrays used for integer indexing instead of iloc lookups. A
+        # column of a row-major frame is a strided view, so force unit stride.
+        # The scans only compare prices on a 0.05 tick grid, so float32 is
+        # enough and halves the bytes read; point prices still come from the
+        # float64 frame
+        highs = np.ascontiguousarray(self.data['high'].to_numpy(dtype=np.float32)) if n else np.empty(0, dtype=np.float32)
+        lows = np.ascontiguousarray(self.data['low'].to_numpy(dtype=np.float32)) if n else np.empty(0, dtype=np.float32)
+        self._highs = highs
+        self._lows = lows
+        self._low_lt_prev[1:] = lows[1:] < lows[:-1]
+        if n < 3:
+            return
+            
+        self._swing_hi[1:-1] = (highs[1:-1] > highs[:-2]) & (highs[1:-1] > highs[2:])
+        self._swing_lo[1:-1] = (lows[1:-1] < lows[:-2]) & (lows[1:-1] < lows[2:])
+        
+        hi_idx = np.flatnonzero(self._swing_hi)
+        lo_idx = np.flatnonzero(self._swing_lo)
+        self.swing_highs = list(zip(hi_idx.tolist(), self._price('high', hi_idx).tolist()))
+        self.swing_lows = list(zip(lo_idx.tolist(), self._price('low', lo_idx).tolist()))
+    
+    def _price(self, column, idx):
+        """
+        Get exact prices from the data.
+        
+        Args:
+            column (str): Price column ('high' or 'low')
+            idx (int or np.ndarray): Row position(s)
+            
+        Returns:
+            float or np.ndarray: Price(s) at the given positions
+        """
+        return self.data[column].to_numpy(dtype=np.float64)[idx]
     
     def initialize_H1_L1(self):
         """Initialize L1 using the low of the first candle."""
         if len(self.data) > 0:
-            self.L1 = self.data.iloc[0]['low']
+            self.L1 = float(self._price('low', 0))
             self.L1_idx = 0
             logger.info(f"POINT INITIALIZATION: L1 initialized to first candle low at {self.L1:.2f}")
             
@@ -240,31 +430,15 @@ class BullishSwingStrategy:
     
     def reset_points(self, which_points):
         """
-        Reset specified structure points.
+        Reset specified structure points. The scan clears points inside
+        _scan_bullish, so this is only used by callers outside the strategy.
         
         Args:
             which_points (list): List of point names to reset (e.g., ['H1', 'L1'])
         """
         for point in which_points:
-            if point == 'H1':
-                self.H1 = None
-                self.H1_idx = None
-            elif point == 'L1':
-                self.L1 = None
-                self.L1_idx = None
-            elif point == 'A':
-                self.A = None
-                self.A_idx = None
-            elif point == 'B':
-                self.B = None
-                self.B_idx = None
-            elif point == 'C':
-                self.C = None
-                self.C_idx = None
-            elif point == 'D':
-                self.D = None
-                self.D_idx = None
-                self.pending_setup = None
+            for attr in self._RESET_MAP.get(point, ()):
+                setattr(self, attr, None)
     
     def refresh_option_greeks(self, current_idx=None, force_refresh=False):
         """
@@ -282,11 +456,11 @@ class BullishSwingStrategy:
             return False
             
         try:
-            current_time = datetime.now()
+            now = time.monotonic()
             
             # Check if we've refreshed recently
-            if hasattr(self, 'last_greeks_refresh') and self.last_greeks_refresh and not force_refresh:
-                elapsed = (current_time - self.last_greeks_refresh).total_seconds()
+            if self._greeks_refresh_mono is not None and not force_refresh:
+                elapsed = now - self._greeks_refresh_mono
                 if elapsed < self.greeks_refresh_interval:
                     logger.debug(f"Using cached Greeks ({elapsed:.1f}s old)")
                     return True
@@ -300,14 +474,15 @@ class BullishSwingStrategy:
             
             # For now, we'll simulate this with a placeholder
             self.cached_options_data = pd.DataFrame()  # This would be real data in practice
-            self.last_greeks_refresh = current_time
+            self._greeks_refresh_mono = now
+            self.last_greeks_refresh = datetime.now()
             
             logger.info(f"Successfully refreshed Greeks")
             return True
             
         except Exception as e:
             logger.error(f"Error refreshing Greeks: {e}")
-            if hasattr(self, 'cached_options_data') and self.cached_options_data is not None:
+            if self.cached_options_data is not None:
                 logger.warning("Continuing with previously fetched options data")
                 return True
             return False
@@ -347,82 +522,76 @@ class BullishSwingStrategy:
         Returns:
             dict: Signal data if breakout detected, None otherwise
         """
-        if self.C is not None and self.D is not None:
-            logger.info(f"Checking live tick at price {price:.2f} against D point {self.D:.2f}")
+        # Most ticks stay at or below D (or there is no structure), so exit early
+        if self.D is None or price <= self.D or self.C is None:
+            return None
             
-            if price > self.D:
-                # Check if we already have an order placed today
-                if self.order_counter >= settings.MAX_SIGNAL_ATTEMPTS:
-                    logger.info(f"Maximum signal attempts reached for today ({self.order_counter}). Skipping.")
-                    return None
-                    
-                logger.info(f"LIVE BREAKOUT DETECTED: Price {price:.2f} broke above D point {self.D:.2f}")
-                
-                if self.pending_setup is None:
-                    # Calculate setup parameters
-                    entry_price = self.D + 0.05
-                    stop_loss = self.C - 0.05
-                    risk_points = entry_price - stop_loss
-                    target = entry_price + (2 * risk_points)
-                    
-                    self.pending_setup = {
-                        'entry_price': entry_price,
-                        'stop_loss': stop_loss,
-                        'target': target,
-                        'structure': {
-                            'H1': (self.H1_idx, self.H1),
-                            'L1': (self.L1_idx, self.L1),
-                            'A': (self.A_idx, self.A),
-                            'B': (self.B_idx, self.B),
-                            'C': (self.C_idx, self.C),
-                            'D': (self.D_idx, self.D)
-                        }
-                    }
-                
-                # Prepare options data for signal
-                if self.cached_options_data is not None and not self.cached_options_data.empty:
-                    options_data = self.cached_options_data
-                else:
-                    self.refresh_option_greeks(force_refresh=True)
-                    options_data = self.cached_options_data
-                
-                if options_data is None or options_data.empty:
-                    logger.error("No options data available for signal generation")
-                    return None
-                
-                # Select the optimal option strike
-                current_price = price
-                entry_price = self.pending_setup['entry_price']
-                stop_loss = self.pending_setup['stop_loss']
-                
-                # Use the OptionData static method to select the optimal strike
-                option, quantity, total_risk = OptionData.select_optimal_strike(
-                    options_data, 
-                    current_price,
-                    target_risk_range=(settings.TARGET_RISK_MIN, settings.TARGET_RISK_MAX),
-                    lot_size=settings.DEFAULT_LOT_SIZE
-                )
-                
-                if option is None:
-                    logger.error("Failed to select an optimal option strike")
-                    return None
-                
-                # Create signal data
-                signal_data = {
-                    'signal': 1,
-                    'entry_price': entry_price,
-                    'stop_loss': stop_loss,
-                    'target': self.pending_setup['target'],
-                    'option_data': option.to_dict(),
-                    'quantity': quantity,
-                    'total_risk': total_risk,
-                    'timestamp': datetime.now()
-                }
-                
-                self.signal_counter += 1
-                return signal_data
-                
-        return None
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f"Checking live tick at price {price:.2f} against D point {self.D:.2f}")
+            
+        # Check if we already have an order placed today
+        if self.order_counter >= settings.MAX_SIGNAL_ATTEMPTS:
+            logger.info(f"Maximum signal attempts reached for today ({self.order_counter}). Skipping.")
+            return None
+            
+        logger.info(f"LIVE BREAKOUT DETECTED: Price {price:.2f} broke above D point {self.D:.2f}")
+        
+        if self.pending_setup is None:
+            # Calculate setup parameters
+            entry_price = self.D + 0.05
+            stop_loss = self.C - 0.05
+            risk_points = entry_price - stop_loss
+            target = entry_price + (2 * risk_points)
+            
+            self.pending_setup = PendingSetup(
+                entry_price=entry_price,
+                stop_loss=stop_loss,
+                target=target,
+                structure=self._pack_structure()
+            )
+        
+        # Prepare options data for signal
+        if self.cached_options_data is not None and not self.cached_options_data.empty:
+            options_data = self.cached_options_data
+        else:
+            self.refresh_option_greeks(force_refresh=True)
+            options_data = self.cached_options_data
+        
+        if options_data is None or options_data.empty:
+            logger.error("No options data available for signal generation")
+            return None
+        
+        # Select the optimal option strike
+        current_price = price
+        entry_price = self.pending_setup.entry_price
+        stop_loss = self.pending_setup.stop_loss
+        
+        # Use the OptionData static method to select the optimal strike
+        option, quantity, total_risk = OptionData.select_optimal_strike(
+            options_data, 
+            current_price,
+            target_risk_range=(settings.TARGET_RISK_MIN, settings.TARGET_RISK_MAX),
+            lot_size=settings.DEFAULT_LOT_SIZE
+        )
+        
+        if option is None:
+            logger.error("Failed to select an optimal option strike")
+            return None
+        
+        # Create signal data
+        signal_data = {
+            'signal': 1,
+            'entry_price': entry_price,
+            'stop_loss': stop_loss,
+            'target': self.pending_setup.target,
+            'option_data': option.to_dict(),
+            'quantity': quantity,
+            'total_risk': total_risk,
+            'timestamp': datetime.now()
+        }
+        
+        self.signal_counter += 1
+        return signal_data
     
     def place_order(self, signal_data):
         """
@@ -500,34 +669,54 @@ class BullishSwingStrategy:
     
     def _save_order_to_csv(self, order_data):
         """
-        Save order data to a CSV file.
+        Append order data to the day's order history CSV file.
         
         Args:
             order_data (dict): Order details
         """
         try:
-            # Generate filename with date
-            date_str = datetime.now().strftime("%Y%m%d")
-            filename = os.path.join(settings.ORDER_HISTORY_DIR, f'order_history_{date_str}.csv')
-            
             # Convert complex objects to strings
             for key, value in order_data.items():
                 if isinstance(value, (dict, list)):
                     order_data[key] = str(value)
                     
-            # Convert to DataFrame for easier CSV handling
-            df = pd.DataFrame([order_data])
-            
-            # Check if file exists to determine headers
-            file_exists = os.path.isfile(filename)
-            
-            # Write to CSV
-            df.to_csv(filename, mode='a', header=not file_exists, index=False)
-            logger.info(f"Saved order details to {filename}")
+            date_str = datetime.now().strftime("%Y%m%d")
+            if self._order_writer is None or date_str != self._order_csv_date:
+                self._open_order_file(date_str, list(order_data))
+                
+            self._order_writer.writerow(order_data)
+            self._order_csv_fh.flush()
+            logger.info(f"Saved order details to {self._order_csv_fh.name}")
             
         except Exception as e:
             logger.error(f"Error saving order to CSV: {e}")
     
+    def _open_order_file(self, date_str, fieldnames):
+        """
+        Open the order history file for a day, keeping the handle for later orders.
+        
+        Args:
+            date_str (str): Date in YYYYMMDD format
+            fieldnames (list): CSV columns
+        """
+        self.close_order_file()
+        filename = os.path.join(settings.ORDER_HISTORY_DIR, f'order_history_{date_str}.csv')
+        self._order_csv_fh = open(filename, 'a', newline='')
+        self._order_writer = csv.DictWriter(self._order_csv_fh, fieldnames=fieldnames, extrasaction='ignore')
+        self._order_csv_date = date_str
+        
+        # Write headers only for a new file
+        if os.path.getsize(filename) == 0:
+            self._order_writer.writeheader()
+    
+    def close_order_file(self):
+        """Close the order history file if it is open."""
+        if self._order_csv_fh is not None:
+            self._order_csv_fh.close()
+        self._order_csv_fh = None
+        self._order_writer = None
+        self._order_csv_date = None
+    
     def generate_signals(self):
         """
         Process historical data to identify structure points and generate signals.
@@ -536,81 +725,157 @@ class BullishSwingStrategy:
             pd.DataFrame: DataFrame with signal information
         """
         # Initialize structure
+        self.detect_swings()
         self.initialize_H1_L1()
+        self._signal_events = []
         
-        for i in range(1, len(self.data)):
-            current_candle = self.data.iloc[i]
-            prev_candle = self.data.iloc[i-1]
-            current_time = self.data.index[i]
-            
-            # L1 detection and updates
-            if self.is_swing_low(i) and current_candle['low'] < self.L1:
-                previous_L1 = self.L1
-                self.L1 = current_candle['low']
-                self.L1_idx = i
-                self.reset_points(['H1', 'A', 'B', 'C', 'D'])
-                logger.info(f"POINT UPDATE: L1 updated from {previous_L1:.2f} to {self.L1:.2f}")
-                
-            # H1 detection and updates
-            if self.L1 is not None and self.is_swing_high(i):
-                if i > self.L1_idx and current_candle['high'] > self.L1:
-                    if self.H1 is None:
-                        self.H1 = current_candle['high']
-                        self.H1_idx = i
-                        logger.info(f"POINT DETECTION: H1 detected at price {self.H1:.2f}")
-                    elif current_candle['high'] > self.H1:
-                        previous_H1 = self.H1
-                        self.H1 = current_candle['high']
-                        self.H1_idx = i
-                        self.reset_points(['A', 'B', 'C', 'D'])
-                        logger.info(f"POINT UPDATE: H1 updated from {previous_H1:.2f} to {self.H1:.2f}")
-                        
-            # A point detection
-            if self.H1 is not None and self.L1 is not None:
-                if self.A is None and self.is_swing_low(i):
-                    if i > self.H1_idx and current_candle['low'] > self.L1:
-                        self.A = current_candle['low']
-                        self.A_idx = i
-                        logger.info(f"POINT DETECTION: A detected at price {self.A:.2f}")
-                        
-            # B point detection
-            if self.A is not None:
-                if self.B is None and self.is_swing_low(i):
-                    if i > self.A_idx + 1 and current_candle['low'] > self.A:
-                        self.B = current_candle['low']
-                        self.B_idx = i
-                        logger.info(f"POINT DETECTION: B detected at price {self.B:.2f}")
-                        
-            # C and D point detection
-            if self.B is not None:
-                if self.C is None:
-                    if i > self.B_idx and current_candle['low'] < prev_candle['low'] and current_candle['low'] > self.B:
-                        self.C = current_candle['low']
-                        self.C_idx = i
-                        logger.info(f"POINT DETECTION: C detected at price {self.C:.2f}")
-                        self.calculate_point_D()
-                        
-            # Breakout detection
-            if self.pending_setup is not None:
-                if current_candle['high'] > self.D:
-                    # Set signal in the signals DataFrame
-                    self.signals.iloc[i, self.signals.columns.get_loc('signal')] = 1
-                    self.signals.iloc[i, self.signals.columns.get_loc('entry_price')] = self.pending_setup['entry_price']
-                    self.signals.iloc[i, self.signals.columns.get_loc('stop_loss')] = self.pending_setup['stop_loss']
-                    self.signals.iloc[i, self.signals.columns.get_loc('target')] = self.pending_setup['target']
-                    
-                    # Record the structure
-                    structure = self.pending_setup['structure'].copy()
-                    structure['entry'] = (i, self.pending_setup['entry_price'])
-                    structure['stop_loss'] = (i, self.pending_setup['stop_loss'])
-                    structure['target'] = (i, self.pending_setup['target'])
-                    self.structures.append(structure)
-                    
-                    logger.info(f"Signal generated at {self.data.index[i]}. Entry: {self.pending_setup['entry_price']:.2f}")
-                    
-                    # Reset points to start looking for new structure
-                    self.reset_points(['H1', 'L1', 'A', 'B', 'C', 'D'])
-                    self.L1 = current_candle['low']
-                    self.L1_idx = i
+        self._scan(1)
+        self.signals = self._build_signals()
+        return self.signals
+    
+    def update(self, new_bars):
+        """
+        Process bars added since the last run without rescanning history.
+        The last two processed bars are run through the structure detection
+        again, since they may have changed; bars before them are ignored, so
+        the full frame can be passed.
+        
+        Args:
+            new_bars (pd.DataFrame): Price data with OHLCV columns, either the
+                full frame or its trailing bars starting no later than the last
+                bar passed before
+            
+        Returns:
+            pd.DataFrame: DataFrame with signal information
+        """
+        if self.data.empty:
+            if new_bars.empty:
+                return self.signals
+            self.data = new_bars
+            return self.generate_signals()
+            
+        if self._resume_ts is not None:
+            new_bars = new_bars[new_bars.index >= self._resume_ts]
+        if new_bars.empty:
+            return self.signals
+            
+
+        self.data = pd.concat([self.data[self.data.index < new_bars.index[0]], new_bars])
+        self.detect_swings()
         
+        if self._checkpoint is not None:
+            self._restore_state(self._checkpoint)
+        self._scan(max(self._next_idx, 1))
+        self.signals = self._build_signals()
         return self.signals
+    
+    def _build_signals(self):
+        """
+        Build the signals DataFrame from the recorded breakout events.
+        
+        Returns:
+            pd.DataFrame: Signal, entry_price, stop_loss and target per candle
+        """
+        n = len(self.data)
+        signal = np.zeros(n, dtype=np.int64)
+        values = np.full((n, 3), np.nan)
+        if self._signal_events:
+            events = np.array(self._signal_events, dtype=np.float64)
+            idx = events[:, 0].astype(np.int64)
+            signal[idx] = 1
+            values[idx] = events[:, 1:]
+            
+        signals = pd.DataFrame(values, index=self.data.index, columns=['entry_price', 'stop_loss', 'target'])
+        signals.insert(0, 'signal', signal)
+        return signals
+    
+    def _scan(self, start):
+        """
+        Run the structure state machine from the given index to the end of
+        the data. The state before the last two bars is saved, since the last
+        bar may still be in progress and the swing flags of the bar before it
+        depend on it; update() rolls back to it and processes both bars again
+        once the last one is complete.
+        
+        Args:
+            start (int): Index of the first bar to process
+        """
+        n = len(self._highs)
+        last = max(n - 2, start)
+        self._run_scan(start, last)
+        self._checkpoint = self._save_state()
+        self._run_scan(last, n)
+        self._next_idx = last
+        self._resume_ts = self.data.index[last] if last < n else None
+        
+    def _save_state(self):
+        """Capture the structure points, pending setup and recorded signal counts."""
+        points = tuple(getattr(self, p) for p in _POINTS)
+        point_idx = tuple(getattr(self, f"{p}_idx") for p in _POINTS)
+        return points, point_idx, self.pending_setup, len(self._signal_events), len(self.structures)
+        
+    def _restore_state(self, state):
+        """Roll back to a state captured by _save_state."""
+        points, point_idx, self.pending_setup, n_events, n_structures = state
+        for name, value, value_idx in zip(_POINTS, points, point_idx):
+            setattr(self, name, value)
+            setattr(self, f"{name}_idx", value_idx)
+        del self._signal_events[n_events:]
+        del self.structures[n_structures:]
+    
+    def _run_scan(self, start, stop):
+        """
+        Run the structure state machine over a range of bars, then record
+        signals and the pending setup.
+        
+        Args:
+            start (int): Index of the first bar to process
+            stop (int): Index after the last bar to process
+        """
+        if stop <= start:
+            return
+            
+        points = np.array([np.nan if getattr(self, p) is None else getattr(self, p) for p in _POINTS], dtype=np.float32)
+        idx = np.array([-1 if getattr(self, f"{p}_idx") is None else getattr(self, f"{p}_idx") for p in _POINTS], dtype=np.int64)
+        if self.pending_setup is not None:
+            setup = np.array([self.pending_setup.entry_price, self.pending_setup.stop_loss, self.pending_setup.target], dtype=np.float64)
+        else:
+            setup = np.full(3, np.nan)
+            
+        ev_idx, ev_px, ev_points, ev_point_idx, d_calculated = _scan_bullish(
+            self._highs, self._lows, self._swing_hi, self._swing_lo, self._low_lt_prev, start, stop, points, idx, setup
+        )
+        
+        # The kernel works on float32 prices, so take the exact point prices
+        # from the frame by index
+        prices = {'high': self._price('high', slice(None)), 'low': self._price('low', slice(None))}
+        log_info = logger.isEnabledFor(logging.INFO)
+        for p, name in enumerate(_POINTS):
+            formed = idx[p] >= 0
+            setattr(self, name, float(prices[_POINT_COLUMNS[p]][idx[p]]) if formed else None)
+            setattr(self, f"{name}_idx", int(idx[p]) if formed else None)
+            
+        for k, i in enumerate(ev_idx.tolist()):
+            point_idx = ev_point_idx[k].tolist()
+            point_px = [float(prices[_POINT_COLUMNS[p]][point_idx[p]]) for p in range(6)]
+            entry_price = point_px[_D] + 0.05
+            stop_loss = point_px[_C] - 0.05
+            target = entry_price + (entry_price - stop_loss) * 2
+            self._signal_events.append((i, entry_price, stop_loss, target))
+            
+            # Record the structure
+            structure = {name: (point_idx[p], point_px[p]) for name, p in _STRUCTURE_ORDER}
+            structure['entry'] = (i, entry_price)
+            structure['stop_loss'] = (i, stop_loss)
+            structure['target'] = (i, target)
+            self.structures.append(structure)
+            
+            if log_info:
+                logger.info(f"Signal generated at {self.data.index[i]}. Entry: {entry_price:.2f}")
+            
+        if np.isnan(setup[0]):
+            self.pending_setup = None
+        elif d_calculated:
+            if log_info:
+                logger.info(f"POINT CALCULATION: D calculated at price {self.D:.2f} at time {self.data.index[self.D_idx]}")
+            self._set_pending_setup()
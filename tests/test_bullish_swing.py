@@ -0,0 +1,55 @@
+"""
+Tests for the bullish swing strategy.
+"""
+import unittest
+import numpy as np
+import pandas as pd
+from ..strategies.bullish_swing import BullishSwingStrategy
+
+def _random_bars(seed, n=150):
+    """Build a random walk of 5-minute bars with prices on a 0.01 grid."""
+    rng = np.random.default_rng(seed)
+    close = np.round(100 + np.cumsum(rng.normal(0, 1, n)), 2)
+    return pd.DataFrame({
+        'open': close,
+        'high': np.round(close + rng.random(n), 2),
+        'low': np.round(close - rng.random(n), 2),
+        'close': close,
+        'volume': 1.0
+    }, index=pd.date_range('2025-01-06 09:15', periods=n, freq='5min'))
+
+def _forming(bars, k, rng):
+    """Return bars up to k with bar k in progress, covering part of its range."""
+    partial = bars.iloc[:k + 1].copy()
+    open_ = bars['open'].iloc[k]
+    partial.iloc[-1, partial.columns.get_loc('high')] = round(open_ + (bars['high'].iloc[k] - open_) * rng.random(), 2)
+    partial.iloc[-1, partial.columns.get_loc('low')] = round(open_ - (open_ - bars['low'].iloc[k]) * rng.random(), 2)
+    return partial
+
+def _state(strategy):
+    """Collect the structure points, structures and pending setup of a strategy."""
+    points = [(getattr(strategy, p), getattr(strategy, f"{p}_idx")) for p in ('L1', 'H1', 'A', 'B', 'C', 'D')]
+    return points, strategy.structures, strategy.pending_setup
+
+class IncrementalUpdateTest(unittest.TestCase):
+    """update() with an in-progress last bar must match a full rescan."""
+
+    def test_matches_full_rescan(self):
+        for seed in range(20):
+            with self.subTest(seed=seed):
+                bars = _random_bars(seed)
+                rng = np.random.default_rng(seed + 1000)
+                
+                strategy = BullishSwingStrategy(_forming(bars, 40, rng))
+                strategy.generate_signals()
+                for k in range(41, len(bars) + 1):
+                    current = _forming(bars, k, rng) if k < len(bars) else bars
+                    strategy.update(current)
+                    
+                full = BullishSwingStrategy(bars)
+                full.generate_signals()
+                pd.testing.assert_frame_equal(strategy.signals, full.signals)
+                self.assertEqual(_state(strategy), _state(full))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,48 @@
+"""
+Tests for OHLCV resampling.
+"""
+import unittest
+import numpy as np
+import pandas as pd
+from ..data.ohlcv import resample_ohlcv
+
+_AGG = {'open': 'first', 'high': 'max', 'low': 'min', 'close': 'last', 'volume': 'sum'}
+
+def _minute_frame(unit, tz=None, periods=1500, seed=0):
+    """Build a gappy one-minute OHLCV frame with the index stored in `unit`."""
+    rng = np.random.default_rng(seed)
+    index = pd.date_range('2025-01-06 09:15', periods=2 * periods, freq='1min', tz=tz).as_unit(unit)
+    index = index[np.sort(rng.choice(2 * periods, periods, replace=False))]
+    return pd.DataFrame({col: rng.random(periods) for col in _AGG}, index=index)
+
+class ResampleOHLCVTest(unittest.TestCase):
+    """resample_ohlcv must agree with DataFrame.resample for every index unit."""
+
+    def test_matches_pandas_resample(self):
+        for unit in ('us', 'ns'):
+            for tz in (None, 'Asia/Kolkata'):
+                df = _minute_frame(unit, tz)
+                for timeframe in ('1min', '3min', '5min', '7min', '15min', '1h', '1D', '1W'):
+                    with self.subTest(unit=unit, tz=tz, timeframe=timeframe):
+                        expected = df.resample(timeframe).agg(_AGG).dropna()
+                        pd.testing.assert_frame_equal(resample_ohlcv(df, timeframe), expected, check_freq=False)
+
+    def test_broker_timestamp_column(self):
+        timestamps = ['2025-01-06T09:15:00+05:30', '2025-01-06T09:16:00+05:30', '2025-01-06T09:20:00+05:30']
+        df = pd.DataFrame({
+            'timestamp': timestamps,
+            'open': [1.0, 2.0, 3.0],
+            'high': [1.5, 2.5, 3.5],
+            'low': [0.5, 1.5, 2.5],
+            'close': [1.2, 2.2, 3.2],
+            'volume': [10.0, 20.0, 30.0]
+        })
+        resampled = resample_ohlcv(df, '5min')
+        
+        self.assertEqual(list(resampled.index), list(pd.to_datetime([timestamps[0], timestamps[2]])))
+        self.assertEqual(resampled['open'].tolist(), [1.0, 3.0])
+        self.assertEqual(resampled['high'].tolist(), [2.5, 3.5])
+        self.assertEqual(resampled['volume'].tolist(), [30.0, 30.0])
+
+if __name__ == '__main__':
+    unittest.main()
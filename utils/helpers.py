@@ -2,12 +2,46 @@
 Helper utilities for the AlgoTrading application.
 """
 import os
-import json
-import re
+import logging
+import functools
+import dataclasses
+import orjson
 import requests
 from datetime import datetime, timedelta
 import pytz
+import pandas as pd
 from ..utils.logger import logger
+from ..models.option import OptionContract
+from ..config import settings
+
+try:
+    import ijson
+except ImportError:
+    ijson = None
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pq = None
+
+# Expiry format attempts, most likely first. ScripMaster itself uses
+# "31DEC2026", so that order is the default
+_EXPIRY_FORMATS = ('%d%b%Y', '%d-%b-%y', '%d-%m-%Y')
+_EXPIRY_FORMATS_DASH_MONTH = ('%d-%b-%y', '%d%b%Y', '%d-%m-%Y')
+_EXPIRY_FORMATS_DASH_NUMERIC = ('%d-%m-%Y', '%d-%b-%y', '%d%b%Y')
+_IST = pytz.timezone('Asia/Kolkata')
+
+# Shared session so repeated ScripMaster fetches reuse the connection. requests
+# already asks for a gzip-encoded response and decodes it while streaming
+_SESSION = requests.Session()
+# Strikes above this are in paise rather than rupees
+_PAISE_STRIKE_THRESHOLD = 100000
+_MONTHS = ('JAN', 'FEB', 'MAR', 'APR', 'MAY', 'JUN', 'JUL', 'AUG', 'SEP', 'OCT', 'NOV', 'DEC')
+
+# OptionContract fields in constructor order
+_OPTION_FIELDS = [field.name for field in dataclasses.fields(OptionContract)]
 
 def get_today_date_range():
     """
@@ -16,8 +50,7 @@ def get_today_date_range():
     Returns:
         tuple: (from_date, to_date, current_time) in format "YYYY-MM-DD HH:MM"
     """
-    ist = pytz.timezone('Asia/Kolkata')
-    now = datetime.now(ist)
+    now = datetime.now(_IST)
     today_str = now.strftime('%Y-%m-%d')  # Format: YYYY-MM-DD
 
     # Market open time (9:15 AM IST)
@@ -29,28 +62,119 @@ def get_today_date_range():
     from_date = f"{today_str} {from_time}"
     to_date = f"{today_str} {to_time}"
 
-    logger.debug(f"Date range: From {from_date} to {to_date}")
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug(f"Date range: From {from_date} to {to_date}")
     return from_date, to_date, now
 
-def fetch_scripmaster_data():
+@functools.lru_cache(maxsize=512)
+def parse_expiry_date(expiry_raw):
+    """
+    Parse a ScripMaster expiry string, picking the format from its shape.
+    Results are cached since the same expiry repeats across many rows.
+    
+    Args:
+        expiry_raw (str): Expiry such as "31DEC2026", "31-Dec-26" or "31-12-2026"
+        
+    Returns:
+        datetime: Parsed expiry or None if the string is not a known format
+    """
+    if '-' not in expiry_raw:
+        formats = _EXPIRY_FORMATS
+    elif expiry_raw[3:4].isalpha():
+        formats = _EXPIRY_FORMATS_DASH_MONTH
+    else:
+        formats = _EXPIRY_FORMATS_DASH_NUMERIC
+        
+    for fmt in formats:
+        try:
+            return datetime.strptime(expiry_raw, fmt)
+        except ValueError:
+            continue
+    return None
+
+@functools.lru_cache(maxsize=512)
+def format_expiry_date(expiry_date_obj):
+    """
+    Format an expiry date as used in SmartAPI symbols, e.g. "31DEC2026".
+    
+    Args:
+        expiry_date_obj (datetime): Expiry date
+        
+    Returns:
+        str: Upper-case expiry string
+    """
+    return f"{expiry_date_obj.day:02d}{_MONTHS[expiry_date_obj.month - 1]}{expiry_date_obj.year}"
+
+def fetch_scripmaster_data(keep=None):
     """
     Fetch the JSON data from AngelOne's ScripMaster API.
+    The download is kept on disk and revalidated with its ETag and
+    Last-Modified headers, so an unchanged file is not downloaded again.
+    With a filter and ijson installed, the file is parsed item by item and
+    instruments that are not kept are never built as a whole list in memory.
     
+    Args:
+        keep (callable, optional): Predicate selecting the instruments to return
+        
     Returns:
         list: List of instruments or None if failed
     """
     url = "https://margincalculator.angelbroking.com/OpenAPI_File/files/OpenAPIScripMaster.json"
+    cache_path = settings.SCRIPMASTER_JSON_CACHE
+    meta_path = f"{cache_path}.meta"
 
     try:
         logger.info("Fetching ScripMaster data...")
-        response = requests.get(url)
-        response.raise_for_status()  # Raise exception for HTTP errors
-        data = response.json()
-        logger.info(f"Successfully fetched data with {len(data)} records.")
-        return data
+        
+        # Conditional request headers from the last download
+        headers = {}
+        if os.path.exists(cache_path) and os.path.exists(meta_path):
+            try:
+                with open(meta_path, 'rb') as f:
+                    meta = orjson.loads(f.read())
+                if meta.get('etag'):
+                    headers['If-None-Match'] = meta['etag']
+                if meta.get('last_modified'):
+                    headers['If-Modified-Since'] = meta['last_modified']
+            except Exception as e:
+                logger.warning(f"Ignoring unreadable ScripMaster cache metadata: {e}")
+                
+        with _SESSION.get(url, headers=headers, stream=True, timeout=settings.SCRIPMASTER_TIMEOUT) as response:
+            response.raise_for_status()  # Raise exception for HTTP errors
+            if response.status_code == 304:
+                logger.info("ScripMaster unchanged, using the cached copy")
+            else:
+                # Write to a temporary file and swap it in once complete
+                tmp_path = f"{cache_path}.tmp"
+                with open(tmp_path, 'wb') as f:
+                    for chunk in response.iter_content(chunk_size=1 << 20):
+                        f.write(chunk)
+                os.replace(tmp_path, cache_path)
+                with open(meta_path, 'wb') as f:
+                    f.write(orjson.dumps({
+                        'etag': response.headers.get('ETag'),
+                        'last_modified': response.headers.get('Last-Modified')
+                    }))
     except requests.exceptions.RequestException as e:
         logger.error(f"Error fetching data: {e}")
         return None
+    except OSError as e:
+        logger.error(f"Error caching ScripMaster data: {e}")
+        return None
+
+    try:
+        with open(cache_path, 'rb') as f:
+            if keep is not None and ijson is not None:
+                data = [item for item in ijson.items(f, 'item', use_float=True) if keep(item)]
+            else:
+                data = orjson.loads(f.read())
+                if keep is not None:
+                    data = [item for item in data if keep(item)]
+        logger.info(f"Successfully fetched data with {len(data)} records.")
+        return data
+    except Exception as e:
+        logger.error(f"Error parsing ScripMaster data: {e}")
+        return None
 
 def get_nearest_expiry_dates(data, num_expiries=2):
     """
@@ -65,41 +189,43 @@ def get_nearest_expiry_dates(data, num_expiries=2):
     """
     logger.info("Finding nearest expiry dates...")
     expiry_dates = set()
-    today = datetime.now().date()
+    today = datetime.now(_IST).date()  # Expiries are IST dates
 
     # Extract all valid expiry dates for NIFTY options
     for item in data:
-        try:
-            if (item.get('exch_seg') == 'NFO' and
-                item.get('instrumenttype') == 'OPTIDX' and
-                item.get('name') == 'NIFTY'):
-
-                expiry_raw = item.get('expiry')
-                if not expiry_raw:
-                    continue
-
-                # Parse expiry date using multiple format attempts
-                try:
-                    # Format like "31-Dec-26"
-                    expiry_date_obj = datetime.strptime(expiry_raw, '%d-%b-%y')
-                except ValueError:
-                    try:
-                        # Format like "31DEC2026"
-                        expiry_date_obj = datetime.strptime(expiry_raw, '%d%b%Y')
-                    except ValueError:
-                        try:
-                            # Last attempt with day-month-year
-                            expiry_date_obj = datetime.strptime(expiry_raw, '%d-%m-%Y')
-                        except ValueError:
-                            continue
-
-                # Only include future expiry dates
-                expiry_date = expiry_date_obj.date()
-                if expiry_date >= today:
-                    expiry_dates.add(expiry_date)
-        except Exception as e:
-            continue
+        # Most rows are not NIFTY, so test the name first
+        get = item.get
+        if (get('name') == 'NIFTY' and
+            get('instrumenttype') == 'OPTIDX' and
+            get('exch_seg') == 'NFO'):
+
+            expiry_raw = get('expiry')
+            if not expiry_raw or not isinstance(expiry_raw, str):
+                continue
+
+            # Parse expiry date; each distinct string is parsed once
+            expiry_date_obj = parse_expiry_date(expiry_raw)
+            if expiry_date_obj is None:
+                continue
+
+            # Only include future expiry dates
+            expiry_date = expiry_date_obj.date()
+            if expiry_date >= today:
+                expiry_dates.add(expiry_date)
+
+    return _format_nearest_expiries(expiry_dates, num_expiries)
 
+def _format_nearest_expiries(expiry_dates, num_expiries):
+    """
+    Pick the nearest expiry dates and format them for display and API use.
+    
+    Args:
+        expiry_dates (set): Future expiry dates
+        num_expiries (int): Number of expiry dates to return
+        
+    Returns:
+        list: List of expiry date dictionaries
+    """
     # Sort expiry dates and get the nearest ones
     sorted_expiry_dates = sorted(expiry_dates)
     nearest_expiries = sorted_expiry_dates[:num_expiries] if sorted_expiry_dates else []
@@ -111,14 +237,14 @@ def get_nearest_expiry_dates(data, num_expiries=2):
         formatted_expiries.append({
             'date_obj': expiry_obj,
             'date': expiry_date,
-            'formatted': expiry_obj.strftime('%d%b%Y').upper(),
+            'formatted': format_expiry_date(expiry_obj),
             'display': expiry_obj.strftime('%d-%b-%Y')
         })
 
     if formatted_expiries:
-        logger.info(f"Found nearest {len(formatted_expiries)} expiry dates:")
-        for i, exp in enumerate(formatted_expiries):
-            logger.info(f"  {i+1}. {exp['display']} (API format: {exp['formatted']})")
+        if logger.isEnabledFor(logging.INFO):
+            lines = [f"  {i+1}. {exp['display']} (API format: {exp['formatted']})" for i, exp in enumerate(formatted_expiries)]
+            logger.info(f"Found nearest {len(formatted_expiries)} expiry dates:\n" + "\n".join(lines))
     else:
         logger.info("No future expiry dates found")
 
@@ -127,109 +253,176 @@ def get_nearest_expiry_dates(data, num_expiries=2):
 def extract_nifty_options_data(data, expiry_dates):
     """
     Extract Nifty options data for specified expiry dates.
+    Filtering and the per-row conversions run as column operations on a
+    DataFrame; expiry strings are parsed once per distinct value.
     
     Args:
         data (list): ScripMaster data
         expiry_dates (list): List of expiry date dictionaries
         
     Returns:
-        list: List of option data dictionaries
+        list: List of OptionContract objects
     """
     logger.info(f"Extracting Nifty options data for {len(expiry_dates)} expiry dates...")
-    nifty_options = []
-    target_dates = [exp['date'] for exp in expiry_dates]
+    target_dates = frozenset(exp['date'] for exp in expiry_dates)
 
     if not data:
-        return nifty_options
+        return []
 
     required_columns = ['token', 'symbol', 'name', 'expiry', 'strike',
                         'lotsize', 'instrumenttype', 'exch_seg', 'tick_size']
 
-    for item in data:
-        try:
-            # Apply filters
-            if (item.get('exch_seg') == 'NFO' and
-                item.get('instrumenttype') == 'OPTIDX' and
-                item.get('name') == 'NIFTY'):
-
-                # Extract only required columns
-                filtered_item = {col: item.get(col) for col in required_columns if col in item}
-
-                # Extract option type (CE/PE) from symbol
-                if 'symbol' in filtered_item:
-                    match = re.search(r'(CE|PE)$', filtered_item['symbol'])
-                    filtered_item['option_type'] = match.group(1) if match else None
-
-                # Format expiry date - handle different possible formats
-                if 'expiry' in filtered_item:
-                    expiry_raw = filtered_item['expiry']
-                    try:
-                        # Try different date formats (for ScripMaster data)
-                        try:
-                            # Format like "31-Dec-26"
-                            expiry_date_obj = datetime.strptime(expiry_raw, '%d-%b-%y')
-                        except ValueError:
-                            try:
-                                # Format like "31DEC2026"
-                                expiry_date_obj = datetime.strptime(expiry_raw, '%d%b%Y')
-                            except ValueError:
-                                # Last attempt with day-month-year
-                                expiry_date_obj = datetime.strptime(expiry_raw, '%d-%m-%Y')
-
-                        # Add formatted versions - all formats needed
-                        expiry_date = expiry_date_obj.date()
-                        filtered_item['expiry_date'] = expiry_date
-                        filtered_item['expiry_formatted'] = expiry_date_obj.strftime('%d%b%Y').upper()
-                        filtered_item['expiry_smartapi'] = expiry_date_obj.strftime('%d%b%Y').upper()
-
-                        # Filter by target dates
-                        if expiry_date not in target_dates:
-                            continue
-
-                    except Exception as e:
-                        filtered_item['expiry_date'] = None
-                        filtered_item['expiry_formatted'] = None
-                        filtered_item['expiry_smartapi'] = None
-                        logger.error(f"Error formatting expiry date '{expiry_raw}': {e}")
-                        continue  # Skip if we can't parse the date correctly
-
-                # Process strike price
-                if 'strike' in filtered_item and filtered_item.get('option_type'):
-                    try:
-                        # Format strike price consistently - handle paise conversion
-                        strike_val = float(filtered_item['strike'])
-
-                        # Check if strike needs conversion from paise to rupees
-                        # Typical NIFTY strikes are 4-5 digits (e.g. 20000, 25000)
-                        # If it's much larger, it's likely in paise
-                        if strike_val > 100000:  # Threshold to detect paise format
-                            # Convert from paise to rupees
-                            strike_val_rupees = strike_val / 100
-                            filtered_item['strike_float'] = strike_val_rupees
-                            filtered_item['original_strike'] = strike_val  # Keep original for reference
-                        else:
-                            filtered_item['strike_float'] = strike_val
-
-                        # Format match key with corrected strike
-                        filtered_item['match_key'] = f"NIFTY_{filtered_item['expiry_smartapi']}_{filtered_item['strike_float']:.2f}_{filtered_item['option_type']}"
-
-                    except (ValueError, TypeError) as e:
-                        logger.error(f"Error formatting strike value: {e}")
-                        continue
-
-                nifty_options.append(filtered_item)
-        except Exception as e:
-            logger.error(f"Error processing item: {e}")
+    try:
+        df = pd.DataFrame(data)
+        if not {'name', 'instrumenttype', 'exch_seg', 'expiry'}.issubset(df.columns):
+            logger.error("ScripMaster data is missing required columns")
+            return []
+
+        # Apply filters and keep only required columns
+        mask = df['name'].eq('NIFTY') & df['instrumenttype'].eq('OPTIDX') & df['exch_seg'].eq('NFO')
+        df = df.loc[mask, [col for col in required_columns if col in df.columns]]
+
+        # Extract option type (CE/PE) from the symbol suffix
+        if 'symbol' in df.columns:
+            suffix = df['symbol'].str[-2:]
+            df['option_type'] = suffix.astype(object).where(suffix.isin(['CE', 'PE']), None)
+
+        # Parse each distinct expiry once; skip rows we can't parse correctly
+        expiry_counts = df['expiry'].value_counts(dropna=False)
+        expiry_dates_by_raw = {}
+        expiry_formatted_by_raw = {}
+        for raw, count in expiry_counts.items():
+            expiry_date_obj = parse_expiry_date(raw) if isinstance(raw, str) and raw else None
+            if expiry_date_obj is None:
+                logger.error(f"Error formatting expiry date '{raw}': unrecognised format ({count} rows)")
+            elif expiry_date_obj.date() in target_dates:
+                expiry_dates_by_raw[raw] = expiry_date_obj.date()
+                expiry_formatted_by_raw[raw] = format_expiry_date(expiry_date_obj)
+
+        # Filter by target dates, then add formatted versions - all formats needed
+        df = df.loc[df['expiry'].isin(list(expiry_dates_by_raw))]
+        df['expiry_date'] = df['expiry'].map(expiry_dates_by_raw).astype(object)
+        df['expiry_formatted'] = df['expiry'].map(expiry_formatted_by_raw).astype(object)
+        df['expiry_smartapi'] = df['expiry_formatted']
+        if 'option_type' in df.columns:
+            has_type = df['option_type'].notna()
+        else:
+            has_type = pd.Series(False, index=df.index)
+
+        # Process strike price. Typical NIFTY strikes are 4-5 digits (e.g.
+        # 20000, 25000); much larger values are in paise
+        if 'strike' in df.columns:
+            strike_val = pd.to_numeric(df['strike'], errors='coerce').astype('float64')
+            invalid = has_type & df['strike'].notna() & strike_val.isna()
+            if invalid.any():
+                logger.error(f"Error formatting strike value for {int(invalid.sum())} options")
+                df, strike_val, has_type = df.loc[~invalid], strike_val[~invalid], has_type[~invalid]
+            has_strike = has_type & strike_val.notna()
+            in_paise = has_strike & (strike_val > _PAISE_STRIKE_THRESHOLD)
+            df['strike_float'] = strike_val.where(~in_paise, strike_val / 100).where(has_strike)
+            df['original_strike'] = strike_val.where(in_paise)
+
+            # Format match key with corrected strike. The key prefix is built
+            # once per expiry and each distinct strike is formatted once
+            df['match_key'] = None
+            if has_strike.any():
+                keyed = df.loc[has_strike]
+                prefixes = {exp: f"NIFTY_{exp}_" for exp in keyed['expiry_smartapi'].unique()}
+                strikes = {strike: f"{strike:.2f}_" for strike in keyed['strike_float'].unique()}
+                df.loc[has_strike, 'match_key'] = (
+                    keyed['expiry_smartapi'].map(prefixes) + keyed['strike_float'].map(strikes) + keyed['option_type']
+                )
+
+        # Fields a row does not have (e.g. strike fields for rows without
+        # an option type) are left as None
+        contracts = df.reindex(columns=_OPTION_FIELDS).astype(object)
+        contracts = contracts.where(contracts.notna(), None)
+        nifty_options = [OptionContract(*row) for row in contracts.itertuples(index=False, name=None)]
+        _write_options_parquet(contracts)
+
+    except Exception as e:
+        logger.error(f"Error processing ScripMaster data: {e}")
+        return []
 
     # Count options per expiry for reporting
-    expiry_counts = {}
-    for option in nifty_options:
-        exp_date = option.get('expiry_date')
-        if exp_date:
-            expiry_counts[exp_date] = expiry_counts.get(exp_date, 0) + 1
-
-    logger.info(f"Found total of {len(nifty_options)} Nifty options records matching criteria.")
-    for exp_date, count in sorted(expiry_counts.items()):
-        logger.info(f"  - {exp_date}: {count} options")
+    if logger.isEnabledFor(logging.INFO):
+        lines = [f"  - {exp_date}: {count} options" for exp_date, count in sorted(df['expiry_date'].value_counts().items())]
+        logger.info("\n".join([f"Found total of {len(nifty_options)} Nifty options records matching criteria."] + lines))
 
     return nifty_options
+
+def _write_options_parquet(contracts):
+    """
+    Save the extracted options table as Parquet so other processes can load
+    it without parsing the ScripMaster. Skipped when pyarrow is not installed.
+    
+    Args:
+        contracts (pd.DataFrame): Options data with the OptionContract columns
+    """
+    if pq is None:
+        return
+        
+    try:
+        path = settings.NIFTY_OPTIONS_PARQUET
+        tmp_path = f"{path}.tmp"
+        pq.write_table(pa.Table.from_pandas(contracts, preserve_index=False), tmp_path)
+        os.replace(tmp_path, path)
+    except Exception as e:
+        logger.warning(f"Error writing options Parquet file: {e}")
+
+def load_nifty_options_parquet(path=None):
+    """
+    Load the options table saved by extract_nifty_options_data.
+    
+    Args:
+        path (str, optional): Parquet file, defaults to settings.NIFTY_OPTIONS_PARQUET
+        
+    Returns:
+        pd.DataFrame: Options data or None if not available
+    """
+    path = path or settings.NIFTY_OPTIONS_PARQUET
+    if pq is None or not os.path.exists(path):
+        return None
+        
+    try:
+        return pq.read_table(path, memory_map=True).to_pandas()
+    except Exception as e:
+        logger.error(f"Error loading options Parquet file {path}: {e}")
+        return None
+
+def load_nifty_options(data, num_expiries=2):
+    """
+    Find the nearest NIFTY option expiries and extract their options data
+    with a single pass over the ScripMaster data. Equivalent to
+    get_nearest_expiry_dates followed by extract_nifty_options_data.
+    
+    Args:
+        data (list): ScripMaster data
+        num_expiries (int): Number of expiry dates to include
+        
+    Returns:
+        tuple: (list of expiry date dictionaries, list of OptionContract objects)
+    """
+    if not data:
+        return [], []
+        
+    logger.info("Finding nearest expiry dates...")
+    today = datetime.now(_IST).date()
+    candidates = []
+    expiry_dates = set()
+    
+    # Collect NIFTY options and their future expiries in one pass
+    for item in data:
+        get = item.get
+        if (get('name') == 'NIFTY' and
+            get('instrumenttype') == 'OPTIDX' and
+            get('exch_seg') == 'NFO'):
+            
+            candidates.append(item)
+            expiry_raw = get('expiry')
+            expiry_date_obj = parse_expiry_date(expiry_raw) if expiry_raw and isinstance(expiry_raw, str) else None
+            if expiry_date_obj is not None and expiry_date_obj.date() >= today:
+                expiry_dates.add(expiry_date_obj.date())
+                
+    expiries = _format_nearest_expiries(expiry_dates, num_expiries)
+    return expiries, extract_nifty_options_data(candidates, expiries)
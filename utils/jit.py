@@ -0,0 +1,15 @@
+"""
+JIT compilation helpers for the AlgoTrading application.
+Uses Numba when it is installed and falls back to plain Python otherwise.
+"""
+try:
+    from numba import njit
+except ImportError:
+    def njit(*args, **kwargs):
+        """
+        No-op replacement for numba.njit.
+        Supports both the bare @njit and the @njit(...) decorator forms.
+        """
+        if len(args) == 1 and callable(args[0]) and not kwargs:
+            return args[0]
+        return lambda fn: fn
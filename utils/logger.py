@@ -14,10 +14,15 @@ formatter = LogFormatter(
     datefmt='%Y-%m-%d %H:%M:%S'
 )
 
+# Configured loggers by name
+_loggers = {}
+
 # Setup root logger
 def get_logger(name=None):
     """
     Get a configured logger instance.
+    Each name is configured once and the same instance is returned on
+    later calls, so handlers are not set up again.
     
     Args:
         name (str, optional): Name of the logger. Defaults to None for root logger.
@@ -25,6 +30,9 @@ def get_logger(name=None):
     Returns:
         Logger: Configured logger instance
     """
+    if name in _loggers:
+        return _loggers[name]
+        
     log_level = getattr(logging, settings.LOG_LEVEL)
     logger = setup_logger(
         name=name,
@@ -35,6 +43,7 @@ def get_logger(name=None):
         backupCount=5,
         disableStderrLogger=False
     )
+    _loggers[name] = logger
     return logger
 
 # Create root logger
@@ -0,0 +1,65 @@
+"""
+Rate limiting utilities for the AlgoTrading application.
+Provides a token bucket used to keep broker API calls within their limits.
+"""
+from time import monotonic
+
+
+class TokenBucket:
+    """
+    Token bucket rate limiter.
+    Tokens refill continuously at `fill_rate` per second up to `capacity`,
+    so short bursts are allowed while the long-run rate stays bounded.
+    """
+
+    def __init__(self, fill_rate, capacity=1):
+        """
+        Initialize a full token bucket.
+
+        Args:
+            fill_rate (float): Number of tokens added per second
+            capacity (int): Maximum number of tokens the bucket can hold
+        """
+        self.fill_rate = float(fill_rate)
+        self.capacity = capacity
+        self._tokens = float(capacity)
+        self.timestamp = monotonic()
+
+    def can_consume(self, tokens=1):
+        """
+        Consume tokens if enough are available.
+
+        Args:
+            tokens (int): Number of tokens to consume
+
+        Returns:
+            bool: True if the tokens were consumed, False otherwise
+        """
+        if tokens <= self._get_tokens():
+            self._tokens -= tokens
+            return True
+        return False
+
+    def expected_time(self, tokens=1):
+        """
+        Get the time until the requested number of tokens is available.
+
+        Args:
+            tokens (int): Number of tokens required
+
+        Returns:
+            float: Seconds to wait, 0 if the tokens are available now
+        """
+        available = self._get_tokens()
+        if tokens <= available:
+            return 0.0
+        return (tokens - available) / self.fill_rate
+
+    def _get_tokens(self):
+        """Refill the bucket based on elapsed time and return the token count."""
+        now = monotonic()
+        if self._tokens < self.capacity:
+            delta = self.fill_rate * (now - self.timestamp)
+            self._tokens = min(self.capacity, self._tokens + delta)
+        self.timestamp = now
+        return self._tokens